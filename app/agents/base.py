@@ -1,16 +1,22 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage
 import os
 import logging
 from typing import List, Optional, Any
+from app.agents.llm_cache import llm_cache
 
 logger = logging.getLogger(__name__)
 
+# Returned instead of an answer when the LLM call fails
+LLM_ERROR_RESPONSE = "I apologize, but I encountered an issue while processing your request. Please try again in a moment."
+
 class BaseAgent:
-    def __init__(self, name: str, system_prompt: str, tools: Optional[List[Any]] = None):
+    def __init__(self, name: str, system_prompt: str, tools: Optional[List[Any]] = None,
+                 context_token_budget: Optional[int] = None):
         self.name = name
         self.system_prompt = system_prompt
         self.tools = tools or []
+        # Tokens of retrieved knowledge this agent's prompt may carry (None: CONTEXT_TOKEN_BUDGET)
+        self.context_token_budget = context_token_budget
         self.llm = self._initialize_llm()
     
     def _initialize_llm(self):
@@ -38,8 +44,8 @@ class BaseAgent:
             logger.error(f"Failed to initialize Gemini: {e}")
             raise
     
-    async def generate_response(self, user_message: str, context: str = "") -> str:
-        """Generate response using Gemini with proper error handling"""
+    async def generate_response(self, user_message: str, context: str = "", use_cache: bool = True) -> str:
+        """Generate response using Gemini with proper error handling; use_cache=False forces a fresh call"""
         try:
             full_prompt = f"""You are: {self.system_prompt}
 
@@ -51,14 +57,14 @@ User question: {user_message}
 Please provide a helpful, accurate response based on the context and your expertise:"""
             
             logger.info(f"Sending request to Gemini for {self.name}")
-            response = await self.llm.ainvoke([HumanMessage(content=full_prompt)])
+            response = await llm_cache.ainvoke(self.llm, full_prompt, use_cache)
             
             logger.info(f"Successfully received response from {self.name}")
-            return response.content
+            return response
             
         except Exception as e:
             logger.error(f"Error in {self.name} response generation: {str(e)}")
-            return f"I apologize, but I encountered an issue while processing your request. Please try again in a moment."
+            return LLM_ERROR_RESPONSE
 
     def to_crewai_agent(self):
         """Convert to CrewAI agent format"""
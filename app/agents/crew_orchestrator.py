@@ -64,7 +64,9 @@ crew = Crew(
 async def chat_with_advisor(request: ChatRequest) -> Dict:
     location = request.location or "Central Ethiopia"
     crop_type = request.crop_type or "maize"
-    rag_context = rag_manager.get_agricultural_context(request.message) or "No additional context available"
+    rag_context = await rag_manager.get_agricultural_context_async(
+        request.message, crop_type=request.crop_type, location=request.location
+    ) or "No additional context available"
     inputs = {
         "location": location,
         "weather_summary": rag_context,
@@ -0,0 +1,177 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./app/data/llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "604800"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+class LLMResponseCache:
+    """Exact-match cache of LLM responses keyed by a hash of (model, parameters, prompt).
+    
+    Stored in SQLite so answers survive restarts; entries expire after the TTL and
+    the least recently used ones are evicted past max_entries. Hits only touch
+    last_used in memory; the times are written with the next put.
+    """
+    
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._touched: Dict[str, float] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """SQLite connection, opened (and the table created) on first use"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, last_used REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+    
+    def key(self, model: str, parameters: Dict[str, Any], prompt: str) -> str:
+        payload = json.dumps({"model": model, "parameters": parameters, "prompt": prompt}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Cached response text, or None when missing or expired"""
+        with self._lock:
+            row = self.connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] < self.ttl_seconds:
+                self._touched[key] = now
+                self.hits += 1
+                return row[0]
+            if row is not None:
+                self._touched.pop(key, None)
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, model: str, response: str):
+        """Store a response, evicting the least recently used entries past max_entries"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            now = time.time()
+            if self._touched:
+                # Flush the hits' recency so eviction below sees it
+                self.connection.executemany(
+                    "UPDATE responses SET last_used = ? WHERE key = ?",
+                    [(used, touched) for touched, used in self._touched.items()]
+                )
+                self._touched.clear()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.connection.commit()
+    
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "path": self.path,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        try:
+            with self._lock:
+                stats["size"] = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error reading LLM cache size: {str(e)}")
+            stats["size"] = 0
+        return stats
+    
+    def _lookup(self, model: str, parameters: Dict[str, Any], prompt: str, use_cache: bool):
+        """(key, cached response) for a call; key is None when the call skips the cache"""
+        if not self.enabled:
+            return None, None
+        if not use_cache:
+            with self._lock:
+                self.bypassed += 1
+            return None, None
+        try:
+            key = self.key(model, parameters, prompt)
+            return key, self.get(key)
+        except Exception as e:
+            # The cache must never fail a call
+            logger.error(f"Error reading LLM cache: {str(e)}")
+            return None, None
+    
+    def _store(self, key: Optional[str], model: str, response: str):
+        if key is None or not response:
+            return
+        try:
+            self.put(key, model, response)
+        except Exception as e:
+            logger.error(f"Error writing LLM cache: {str(e)}")
+    
+    async def ainvoke(self, llm, prompt: str, use_cache: bool = True) -> str:
+        """Text of a LangChain chat model's answer to a single-message prompt, through the cache"""
+        from langchain.schema import HumanMessage
+        model = getattr(llm, "model", type(llm).__name__)
+        parameters = {
+            "temperature": getattr(llm, "temperature", None),
+            "max_tokens": getattr(llm, "max_output_tokens", getattr(llm, "max_tokens", None))
+        }
+        # SQLite reads and writes block, so keep them off the event loop
+        key, cached = await asyncio.to_thread(self._lookup, model, parameters, prompt, use_cache)
+        if cached is not None:
+            return cached
+        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        await asyncio.to_thread(self._store, key, model, response.content)
+        return response.content
+    
+    def generate(self, client, prompt: str, use_cache: bool = True) -> str:
+        """Text of a google.generativeai GenerativeModel's answer to a prompt, through the cache"""
+        model = getattr(client, "model_name", type(client).__name__)
+        parameters = {"generation_config": getattr(client, "_generation_config", None)}
+        key, cached = self._lookup(model, parameters, prompt, use_cache)
+        if cached is not None:
+            return cached
+        text = client.generate_content(prompt).text
+        self._store(key, model, text)
+        return text
+
+# Initialize the shared LLM response cache
+llm_cache = LLMResponseCache()
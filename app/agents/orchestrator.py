@@ -2,14 +2,18 @@ from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from app.models.schemas import ChatRequest, ChatResponse, AgentResponse, AgentType, UserCreate, UserLogin, Token
 from app.workflows.weather_alert import RealWeatherWorkflow , weather_alert # Assuming this is the weather workflow
-from app.agents.base import BaseAgent
+from app.agents.base import BaseAgent, LLM_ERROR_RESPONSE
 from typing import List, Dict, Any, Optional
 from app.rag.rag_manager import rag_manager
+from app.rag.context_builder import CONTEXT_TOKEN_BUDGET
+from app.rag.answer_cache import answer_cache
+from app.agents.llm_cache import llm_cache
 from app.workflows.simple_weather import simple_weather
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import logging
+import asyncio
 import os
 import dotenv
 
@@ -29,6 +33,7 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 WEATHER_ALERTS_FILE = "weather_alerts_log.json"
+AGRONOMIST_CONTEXT_TOKENS = int(os.getenv("AGRONOMIST_CONTEXT_TOKENS", str(CONTEXT_TOKEN_BUDGET)))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -87,7 +92,7 @@ class AgronomistAgent(BaseAgent):
         - Harvesting and post-harvest handling
         
         Be specific to Ethiopian growing conditions and use simple, clear language."""
-        super().__init__("Agronomist", system_prompt)
+        super().__init__("Agronomist", system_prompt, context_token_budget=AGRONOMIST_CONTEXT_TOKENS)
 
 class WeatherAdvisorAgent(BaseAgent):
     def __init__(self):
@@ -125,15 +130,17 @@ class OrchestratorAgent:
             agents_to_engage.append(AgentType.AGRONOMIST)
         return agents_to_engage
 
-    async def get_agent_response(self, agent_type: AgentType, query: str, state: Dict) -> AgentResponse:
-        """Get response from a specific agent with shared state"""
+    async def get_agent_response(self, agent_type: AgentType, query: str, state: Dict, use_cache: bool = True) -> AgentResponse:
+        """Get response from a specific agent with shared state; use_cache=False skips the LLM response cache"""
         try:
             context = state.get("context", "")
             if agent_type == AgentType.WEATHER_ADVISOR:
                 location = state.get("location", "Central Ethiopia")
                 weather_data = self.weather_workflow.get_real_weather_data(location)
                 state["weather_data"] = weather_data  
-                response = await self.weather_advisor.generate_response(query, f"Weather Context: {weather_data}")
+                response = await self.weather_advisor.generate_response(query, f"Weather Context: {weather_data}", use_cache)
+                if response == LLM_ERROR_RESPONSE:
+                    state["degraded"] = True
                 return AgentResponse(
                     agent_type=AgentType.WEATHER_ADVISOR,
                     response=response,
@@ -142,36 +149,29 @@ class OrchestratorAgent:
                 )
             elif agent_type == AgentType.AGRONOMIST:
                 weather_context = f"Weather: {state.get('weather_data', 'No weather data available')}" if "weather_data" in state else ""
-                rag_context = rag_manager.get_agricultural_context(query)
-                full_context = f"{weather_context}\n\nRelevant Agricultural Knowledge: {rag_context}"
-                response = await self.agronomist.generate_response(query, full_context)
+                packed = await rag_manager.build_context_async(
+                    query, token_budget=self.agronomist.context_token_budget,
+                    crop_type=state.get("crop_type"), location=state.get("region")
+                )
+                full_context = f"{weather_context}\n\nRelevant Agricultural Knowledge: {packed['context']}"
+                response = await self.agronomist.generate_response(query, full_context, use_cache)
+                if packed.get("fallback") or response == LLM_ERROR_RESPONSE:
+                    state["degraded"] = True
                 return AgentResponse(
                     agent_type=AgentType.AGRONOMIST,
                     response=response,
                     confidence=0.85,
-                    sources=self._extract_sources_from_context(rag_context)
+                    sources=packed["sources"] or [{"type": "ai_model", "model": "Gemini Pro"}]
                 )
         except Exception as e:
             logger.error(f"Error from {agent_type}: {str(e)}")
+            state["degraded"] = True
             return AgentResponse(
                 agent_type=agent_type,
                 response=f"The {agent_type.value} is currently unavailable. Please try again later.",
                 confidence=0.1
             )
 
-    def _extract_sources_from_context(self, rag_context: str) -> List[dict]:
-        """Extract source information from RAG context"""
-        sources = []
-        if "From " in rag_context and "relevance:" in rag_context:
-            lines = rag_context.split('\n')
-            for line in lines:
-                if line.startswith('From '):
-                    source_name = line.split('From ')[1].split(' (relevance:')[0]
-                    sources.append({"type": "document", "name": source_name, "provider": "agricultural_knowledge_base"})
-        if not sources:
-            sources.append({"type": "ai_model", "model": "Gemini Pro"})
-        return sources
-
     def format_response(self, agent_responses: List[AgentResponse]) -> str:
         """Combine agent responses into a coherent answer"""
         if not agent_responses:
@@ -216,20 +216,34 @@ async def chat_with_advisor(request: ChatRequest):
         
         state = {
             "context": f"Location: {request.location or 'Ethiopia'}, Crop: {request.crop_type or 'maize'}",
-            "location": request.location or "Central Ethiopia"
+            "location": request.location or "Central Ethiopia",
+            "crop_type": request.crop_type,
+            "region": request.location
         }
         
         agents_needed = orchestrator.analyze_query(request.message)
         logger.info(f"Agents needed: {agents_needed}")
         
+        conversation_id = request.conversation_id or f"conv_{hash(request.message) % 10000}"
+        partition = answer_cache.partition(request.crop_type, request.location, AgentType.WEATHER_ADVISOR in agents_needed)
+        if request.bypass_cache:
+            answer_cache.record_bypass()
+        else:
+            cached = await asyncio.to_thread(answer_cache.lookup, request.message, partition)
+            if cached is not None:
+                return cached.model_copy(update={"conversation_id": conversation_id})
+        
         agent_responses = []
         for agent_type in agents_needed:
             try:
-                response = await orchestrator.get_agent_response(agent_type, request.message, state)
+                response = await orchestrator.get_agent_response(
+                    agent_type, request.message, state, use_cache=not request.bypass_cache
+                )
                 agent_responses.append(response)
                 state["context"] += f"\n\nPrevious Response ({response.agent_type.value}): {response.response}"
             except Exception as agent_error:
                 logger.error(f"Error from {agent_type}: {str(agent_error)}")
+                state["degraded"] = True
                 agent_responses.append(AgentResponse(
                     agent_type=agent_type,
                     response=f"The {agent_type.value} is currently unavailable.",
@@ -238,9 +252,9 @@ async def chat_with_advisor(request: ChatRequest):
         
         combined_response = orchestrator.format_response(agent_responses)
         
-        return ChatResponse(
+        chat_response = ChatResponse(
             response=combined_response,
-            conversation_id=request.conversation_id or f"conv_{hash(request.message) % 10000}",
+            conversation_id=conversation_id,
             agent_breakdown=agent_responses,
             follow_up_questions=[
                 "What specific variety are you growing?",
@@ -249,6 +263,10 @@ async def chat_with_advisor(request: ChatRequest):
                 "Have you noticed any pests?"
             ]
         )
+        if not state.get("degraded"):
+            # Answers built on a failed LLM call or without the knowledge base are not worth repeating
+            await asyncio.to_thread(answer_cache.store, request.message, partition, chat_response)
+        return chat_response
     except Exception as e:
         logger.error(f"Chat endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -279,6 +297,26 @@ async def get_rag_status():
     status = rag_manager.get_knowledge_base_status()
     return status
 
+@router.get("/rag/cache")
+async def get_rag_cache_stats():
+    """Get hit/miss counters of the retrieval caches"""
+    return rag_manager.get_cache_stats()
+
+@router.get("/chat/cache")
+async def get_answer_cache_stats():
+    """Get size and hit rate of the semantic answer cache"""
+    return answer_cache.stats()
+
+@router.get("/llm/cache")
+async def get_llm_cache_stats():
+    """Get size and hit rate of the persistent LLM response cache"""
+    return await asyncio.to_thread(llm_cache.stats)
+
+@router.get("/rag/executor")
+async def get_rag_executor_stats():
+    """Get queue depth and latency of the retrieval executor"""
+    return rag_manager.get_retrieval_stats()
+
 @router.post("/rag/initialize")
 async def initialize_rag():
     """Initialize the RAG knowledge base with documents"""
@@ -306,14 +344,24 @@ async def clear_rag():
         logger.error(f"Error clearing RAG: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to clear knowledge base")
 
+@router.post("/rag/compact")
+async def compact_rag(dry_run: bool = False):
+    """Delete orphaned Chroma segments, vacuum the database and report the bytes reclaimed"""
+    from app.rag.vector_store import vector_store
+    report = await asyncio.to_thread(vector_store.compact_storage, dry_run)
+    if "error" in report:
+        raise HTTPException(status_code=500, detail=f"Failed to compact knowledge base: {report['error']}")
+    return report
+
 @router.post("/workflows/weather-alert")
 async def trigger_weather_alert(
     location: str = "Central Ethiopia",
-    use_real_weather: bool = True
+    use_real_weather: bool = True,
+    use_cache: bool = True
 ):
-    """Enhanced weather alert with real API data"""
+    """Enhanced weather alert with real API data; use_cache=false forces fresh advice"""
     try:
-        result = weather_alert.generate_weather_alert(location, use_real_weather)
+        result = weather_alert.generate_weather_alert(location, use_real_weather, use_cache)
         return result
     except Exception as e:
         logger.error(f"Weather alert error: {e}")
@@ -356,11 +404,12 @@ async def get_example_questions():
 @router.post("/workflows/weather-alert-enhanced")
 async def enhanced_weather_alert(
     location: str = "Central Ethiopia",
-    use_real_weather: bool = True
+    use_real_weather: bool = True,
+    use_cache: bool = True
 ):
-    """Enhanced weather alert with risk scoring for n8n"""
+    """Enhanced weather alert with risk scoring for n8n; use_cache=false forces fresh advice"""
     try:
-        weather_result = weather_alert.generate_weather_alert(location, use_real_weather)
+        weather_result = weather_alert.generate_weather_alert(location, use_real_weather, use_cache)
         
         alert_analysis = analyze_weather_risk(weather_result, location)
         
@@ -1,6 +1,9 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import asyncio
 import logging
 import os
 import sys
@@ -15,8 +18,28 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up RAG resources in the background so /health answers immediately"""
+    warm_up_task = None
+    from app.rag.rag_manager import rag_manager
+    # Reads only the persisted manifest (or unpacks a prebuilt snapshot), so a deploy never re-ingests inside the first request
+    snapshot_path = os.getenv("KB_SNAPSHOT")
+    if snapshot_path and os.path.exists(snapshot_path):
+        await asyncio.to_thread(rag_manager.load_snapshot, snapshot_path)
+    else:
+        rag_manager.restore()
+    if os.getenv("RAG_WARM_UP", "true").lower() == "true":
+        warm_up_task = asyncio.create_task(asyncio.to_thread(rag_manager.warm_up))
+    yield
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    from app.rag.retrieval_executor import retrieval_executor
+    retrieval_executor.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="AI Crop Advisor API",
     description="An intelligent agricultural advisory system with RAG and multi-agent architecture",
     version="1.0.0",
@@ -58,6 +81,21 @@ async def health_check():
         "rag_initialized": False
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Report whether the embedding model and vector store are loaded"""
+    from app.rag.rag_manager import rag_manager
+    
+    ready = rag_manager.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "warming_up",
+            "service": "AI Crop Advisor API",
+            "rag_ready": ready
+        }
+    )
+
 # Import routers with error handling
 try:
     from app.agents.orchestrator import router  # Ensure this matches your file structure
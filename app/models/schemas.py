@@ -13,12 +13,14 @@ class ChatRequest(BaseModel):
     location: Optional[str] = "Central Ethiopia"
     crop_type: Optional[str] = "maize"
     conversation_id: Optional[str] = None
+    # Skip the semantic answer and LLM response caches and generate a fresh answer
+    bypass_cache: bool = False
 
 class AgentResponse(BaseModel):
     agent_type: AgentType
     response: str
     confidence: Optional[float] = None
-    sources: Optional[List[Dict[str, str]]] = []
+    sources: Optional[List[Dict[str, Any]]] = []
 
 class ChatResponse(BaseModel):
     response: str
@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+import numpy as np
+from app.rag.embeddings import embedding_engine
+from app.rag.metadata_tagger import detect_crops, detect_regions
+from app.rag.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "21600"))
+# Cosine similarity above which a past question counts as a paraphrase
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# Answers that used live weather are only reused within the same window
+WEATHER_BUCKET_SECONDS = int(os.getenv("WEATHER_BUCKET_SECONDS", "10800"))
+
+def _canonical(value: Optional[str], detected) -> str:
+    names = detected(value or "")
+    return names[0] if names else normalize_query(value or "")
+
+def weather_bucket(uses_weather: bool, now: Optional[float] = None) -> str:
+    """Time window for answers built on live weather; other answers do not depend on it"""
+    if not uses_weather:
+        return "none"
+    return str(int((now if now is not None else time.time()) // WEATHER_BUCKET_SECONDS))
+
+class SemanticAnswerCache:
+    """Past answers keyed by question embedding, partitioned by crop, region and weather bucket.
+    
+    A lookup returns the answer to the most similar earlier question of the same
+    partition when its cosine similarity reaches the threshold. Entries expire after
+    the TTL and the least recently used ones are evicted past max_size.
+    """
+    
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, enabled: bool = ANSWER_CACHE):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._partitions: Dict[Tuple[str, str, str], set] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def partition(self, crop_type: Optional[str], location: Optional[str], uses_weather: bool) -> Tuple[str, str, str]:
+        """Canonical crop and region names (so "Corn" and "maize" share answers) plus weather bucket"""
+        return (_canonical(crop_type, detect_crops), _canonical(location, detect_regions), weather_bucket(uses_weather))
+    
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        if not embedding_engine.is_loaded:
+            # Not worth loading the model for; the request path loads it for retrieval
+            return None
+        return embedding_engine.embed_query(query)
+    
+    def _drop(self, key: Hashable):
+        _, _, stored_partition, _ = self._entries.pop(key)
+        keys = self._partitions[stored_partition]
+        keys.discard(key)
+        if not keys:
+            del self._partitions[stored_partition]
+    
+    def lookup(self, query: str, partition: Tuple[str, str, str]) -> Optional[Any]:
+        """Cached answer to a paraphrase of the query in the same partition, or None"""
+        if not self.enabled:
+            return None
+        embedding = self._embed(query)
+        if embedding is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            keys = list(self._partitions.get(partition, ()))
+            for key in keys:
+                if now - self._entries[key][3] >= self.ttl_seconds:
+                    self._drop(key)
+            keys = [key for key in keys if key in self._entries]
+            if keys:
+                similarities = np.vstack([self._entries[key][0] for key in keys]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    logger.info(f"Answer cache hit (similarity {similarities[best]:.3f}) for query: {query}")
+                    return self._entries[keys[best]][1]
+            self.misses += 1
+            return None
+    
+    def store(self, query: str, partition: Tuple[str, str, str], answer: Any):
+        """Remember the answer to a query, evicting the least recently used past max_size"""
+        if not self.enabled or self.max_size <= 0:
+            return
+        embedding = self._embed(query)
+        if embedding is None:
+            return
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (embedding, answer, partition, time.monotonic())
+            self._partitions.setdefault(partition, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+    
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# Initialize the shared answer cache
+answer_cache = SemanticAnswerCache()
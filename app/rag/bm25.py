@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import math
+import heapq
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_FILENAME = "bm25_index.json"
+EXPORT_PAGE_SIZE = 1000
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[-\'][a-z0-9]+)*')
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its my of on or should "
+    "that the their there these this to was what when where which why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords; numbers and codes like DAP or 18-46-0 are kept"""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    return dict(Counter(tokenize(text)))
+
+class BM25Index:
+    """Inverted index (term -> {chunk id: term frequency}) scored with Okapi BM25.
+    
+    A forward map (chunk id -> terms), rebuilt on load, lets a chunk's postings be
+    removed without scanning the whole vocabulary.
+    """
+    
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75):
+        self.path = os.path.join(directory, BM25_FILENAME)
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.chunk_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+    
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.doc_lengths
+    
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        index = cls(directory)
+        if not os.path.exists(index.path):
+            return index
+        try:
+            with open(index.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            index.k1, index.b = data.get("k1", index.k1), data.get("b", index.b)
+            index.doc_lengths = data["doc_lengths"]
+            index.postings = {term: dict(postings) for term, postings in data["postings"].items()}
+            index.total_length = sum(index.doc_lengths.values())
+            for term, postings in index.postings.items():
+                for chunk_id in postings:
+                    index.chunk_terms.setdefault(chunk_id, []).append(term)
+            logger.info(f"Loaded BM25 index with {len(index)} chunks and {len(index.postings)} terms")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable BM25 index {index.path}: {str(e)}")
+            index.postings, index.doc_lengths, index.chunk_terms, index.total_length = {}, {}, {}, 0
+        return index
+    
+    def save(self):
+        """Atomically persist the postings next to the vector store"""
+        with self._lock:
+            data = {
+                "k1": self.k1,
+                "b": self.b,
+                "doc_lengths": self.doc_lengths,
+                "postings": {term: list(postings.items()) for term, postings in self.postings.items()}
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+    
+    def add(self, chunk_id: str, frequencies: Dict[str, int]):
+        """Index (or re-index) one chunk from its term frequencies"""
+        with self._lock:
+            if chunk_id in self.doc_lengths:
+                self.remove([chunk_id])
+            for term, count in frequencies.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+            self.chunk_terms[chunk_id] = list(frequencies)
+            length = sum(frequencies.values())
+            self.doc_lengths[chunk_id] = length
+            self.total_length += length
+    
+    def remove(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                if chunk_id not in self.doc_lengths:
+                    continue
+                self.total_length -= self.doc_lengths.pop(chunk_id)
+                for term in self.chunk_terms.pop(chunk_id, ()):
+                    postings = self.postings.get(term)
+                    if postings is None:
+                        continue
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+    
+    def clear(self):
+        with self._lock:
+            self.postings, self.doc_lengths, self.chunk_terms, self.total_length = {}, {}, {}, 0
+    
+    def rebuild(self, collection):
+        """Re-index every chunk stored in a Chroma collection (for stores built before the index existed)"""
+        with self._lock:
+            self.clear()
+            offset = 0
+            while True:
+                page = collection.get(include=["documents"], limit=EXPORT_PAGE_SIZE, offset=offset)
+                if not page['ids']:
+                    break
+                for chunk_id, document in zip(page['ids'], page['documents']):
+                    self.add(chunk_id, term_frequencies(document or ""))
+                offset += len(page['ids'])
+            logger.info(f"Rebuilt BM25 index with {len(self)} chunks")
+    
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Top chunk ids by BM25 score, best first"""
+        with self._lock:
+            if not self.doc_lengths:
+                return []
+            count = len(self.doc_lengths)
+            average_length = self.total_length / count or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: (item[1], item[0]))
@@ -0,0 +1,144 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.rag.bm25 import tokenize
+from app.rag.embeddings import embedding_engine
+from app.rag.query_cache import LRUCache
+from app.rag.sentence_compressor import CONTEXT_COMPRESSION, sentence_compressor
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+# 1.0 ranks by relevance only, lower values trade relevance for diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Chunks retrieved for packing, so MMR has alternatives to redundant ones
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+# Chunk vectors kept in memory for MMR; the request path never writes the disk embedding cache
+CHUNK_VECTOR_CACHE_SIZE = int(os.getenv("CHUNK_VECTOR_CACHE_SIZE", "4096"))
+# A chunk cut to fit the remaining budget keeps at least this many tokens
+MIN_CHUNK_TOKENS = 40
+# Gemini does not expose its tokenizer offline; ~4 characters per token for English text
+CHARS_PER_TOKEN = 4
+NO_CONTEXT = "No specific agricultural knowledge found for this query. Relying on general knowledge."
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, preferring a sentence end over a word break"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 3]
+    sentence_end = cut.rfind('. ')
+    if sentence_end > len(cut) // 2:
+        return cut[:sentence_end + 1]
+    return cut.rsplit(' ', 1)[0] + "..."
+
+def _jaccard_matrix(texts: List[str]) -> np.ndarray:
+    token_sets = [set(tokenize(text)) for text in texts]
+    matrix = np.zeros((len(texts), len(texts)), dtype=np.float32)
+    for i, left in enumerate(token_sets):
+        for j in range(i, len(texts)):
+            union = left | token_sets[j]
+            matrix[i, j] = matrix[j, i] = len(left & token_sets[j]) / len(union) if union else 0.0
+    return matrix
+
+class ContextBuilder:
+    """Packs retrieved chunks into prompt context within a token budget.
+    
+    Chunks are taken in maximal marginal relevance order, so a chunk that repeats
+    one already packed loses out to a less similar one, and the result carries
+    structured source records alongside the prompt text.
+    """
+    
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, mmr_lambda: float = MMR_LAMBDA,
+                 cache_size: int = CHUNK_VECTOR_CACHE_SIZE):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.chunk_cache = LRUCache(cache_size)
+    
+    def _similarities(self, query: str, results: List[Dict[str, Any]]):
+        """Query relevance of each chunk and chunk-to-chunk similarity"""
+        contents = [result['content'] for result in results]
+        if embedding_engine.is_loaded:
+            vectors = embedding_engine.embed_memoized(contents, self.chunk_cache)
+            return vectors @ embedding_engine.embed_query(query), vectors @ vectors.T
+        # Model still loading (BM25 fast path): fall back to the retrieval score and term overlap
+        relevance = np.array([result.get('relevance_score', 0.0) for result in results], dtype=np.float32)
+        return relevance, _jaccard_matrix(contents)
+    
+    def select(self, query: str, results: List[Dict[str, Any]], max_chunks: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Order results by maximal marginal relevance, keeping at most max_chunks"""
+        if len(results) <= 1:
+            return list(results)
+        limit = min(max_chunks or len(results), len(results))
+        relevance, similarity = self._similarities(query, results)
+        
+        selected: List[int] = []
+        remaining = list(range(len(results)))
+        while remaining and len(selected) < limit:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            selected.append(remaining.pop(int(np.argmax(scores))))
+        return [results[i] for i in selected]
+    
+    def build(self, query: str, results: List[Dict[str, Any]], token_budget: Optional[int] = None,
+              max_chunks: Optional[int] = None, compression_ratio: Optional[float] = None) -> Dict[str, Any]:
+        """Prompt context plus one source record per packed chunk.
+        
+        With CONTEXT_COMPRESSION on, each chunk is cut down to its sentences most
+        relevant to the query before packing, so more sources fit the budget.
+        """
+        budget = token_budget or self.token_budget
+        parts, sources, used, original = [], [], 0, 0
+        for result in self.select(query, results, max_chunks):
+            metadata = result['metadata']
+            relevance = result.get('relevance_score', 0.0)
+            if budget - used < MIN_CHUNK_TOKENS:
+                # Not even a cut-down chunk fits any more
+                break
+            header = f"From {metadata.get('source', 'unknown')} (relevance: {relevance:.2f}): "
+            available = budget - used - estimate_tokens(header)
+            content = result['content']
+            if available < MIN_CHUNK_TOKENS and estimate_tokens(content) > available:
+                # Too little room to cut this one down, so not worth compressing; a shorter chunk may still fit
+                continue
+            if CONTEXT_COMPRESSION:
+                content = sentence_compressor.compress(query, content, compression_ratio)
+            compressed = content
+            if estimate_tokens(content) > available:
+                if available < MIN_CHUNK_TOKENS:
+                    # Too little room left to cut this one down; a shorter chunk may still fit
+                    continue
+                content = truncate_to_tokens(content, available)
+            part = header + content
+            parts.append(part)
+            used += estimate_tokens(part) + 1
+            original += estimate_tokens(result['content'])
+            sources.append({
+                "type": "document",
+                "name": metadata.get('source', 'unknown'),
+                "provider": "agricultural_knowledge_base",
+                "relevance": round(float(relevance), 3),
+                "crop": metadata.get('crop'),
+                "region": metadata.get('region'),
+                "tokens": estimate_tokens(content),
+                "original_tokens": estimate_tokens(result['content']),
+                "truncated": content != compressed
+            })
+        
+        return {
+            "context": "\n\n".join(parts) if parts else NO_CONTEXT,
+            "sources": sources,
+            "tokens": used,
+            "original_tokens": original,
+            "token_budget": budget
+        }
+
+# Initialize the shared context builder
+context_builder = ContextBuilder()
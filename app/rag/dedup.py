@@ -0,0 +1,97 @@
+import os
+import re
+import zlib
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SIGNATURES_FILENAME = "minhash_signatures.npz"
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+class MinHasher:
+    """MinHash signatures over word shingles"""
+    
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        """32-bit hashes of the lowercased word k-grams of a text"""
+        words = _TOKEN_PATTERN.findall(text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64)
+    
+    def signature(self, text: str) -> np.ndarray:
+        """Minimum of num_perm universal hash permutations over the shingles"""
+        hashes = self.shingle_hashes(text)[:, None]
+        permuted = ((hashes * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0)
+
+class NearDuplicateIndex:
+    """LSH-banded MinHash index that finds an already indexed near-duplicate of a chunk"""
+    
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = 64, bands: int = 16):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+    
+    def signature(self, text: str) -> np.ndarray:
+        return self.hasher.signature(text)
+    
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def add(self, key: str, signature: np.ndarray):
+        """Index a kept chunk so later chunks can be matched against it"""
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+    
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """Return the most similar indexed chunk whose estimated Jaccard passes the threshold"""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+            
+        best_key, best_similarity = None, self.threshold
+        for key in sorted(candidates):
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key
+
+def load_signatures(directory: str) -> Dict[str, np.ndarray]:
+    """Load stored signatures keyed by chunk content hash"""
+    path = os.path.join(directory, SIGNATURES_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as data:
+            return dict(zip(data["keys"].tolist(), data["signatures"]))
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable signature file {path}: {str(e)}")
+        return {}
+
+def save_signatures(directory: str, signatures: Dict[str, np.ndarray]):
+    """Persist signatures keyed by chunk content hash"""
+    path = os.path.join(directory, SIGNATURES_FILENAME)
+    keys = np.array(list(signatures), dtype=str)
+    matrix = np.vstack(list(signatures.values())) if signatures else np.zeros((0, 0), dtype=np.uint64)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, keys=keys, signatures=matrix)
+    os.replace(tmp_path, path)
@@ -1,17 +1,53 @@
 import os
 import PyPDF2
 import logging
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import hashlib
+import re
+from app.rag.embeddings import embedding_engine
+from app.rag.bm25 import term_frequencies
+from app.rag.metadata_tagger import TAGGER_VERSION, tag_metadata
 
 logger = logging.getLogger(__name__)
 
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+CHUNK_BY_SENTENCE = os.getenv("CHUNK_BY_SENTENCE", "false").lower() == "true"
+
+_WORD_PATTERN = re.compile(r'\S+')
+_SENTENCE_END_CHARS = '.!?'
+_CLOSING_CHARS = '"\')]'
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the raw text of pages [start, end) of a PDF (runs in worker processes)"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[page_num].extract_text() or "" for page_num in range(start, end)]
+
+def _count_pdf_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF without extracting any text"""
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _read_text_file(file_path: str) -> List[str]:
+    """Read a .txt document (runs in worker processes)"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return [file.read()]
+
 class DocumentProcessor:
     def __init__(self):
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_engine = embedding_engine
         self.supported_formats = ['.pdf', '.txt']
     
+    @property
+    def embedding_model(self):
+        """The shared SentenceTransformer, loaded on first access"""
+        return self.embedding_engine.model
+    
     def load_pdf_document(self, file_path: str) -> List[str]:
         """Extract text from PDF file"""
         try:
@@ -42,20 +78,208 @@ class DocumentProcessor:
             logger.error(f"Error loading text file {file_path}: {str(e)}")
             return []
     
-    def chunk_text(self, text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+    def chunk_spans(self, text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    respect_sentences: bool = CHUNK_BY_SENTENCE) -> List[Tuple[int, int]]:
+        """Compute (start, end) character offsets of overlapping chunks of up to chunk_size words.
+        
+        Only word offsets are collected, so no intermediate strings are built. With
+        respect_sentences, a chunk ends at the last sentence boundary in its second half.
+        """
+        starts, ends = [], []
+        for match in _WORD_PATTERN.finditer(text):
+            starts.append(match.start())
+            ends.append(match.end())
         
-        for i in range(0, len(words), chunk_size - chunk_overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            chunks.append(chunk)
-            if i + chunk_size >= len(words):
+        spans = []
+        word_count = len(starts)
+        i = 0
+        while i < word_count:
+            end = min(i + chunk_size, word_count)
+            if respect_sentences and end < word_count:
+                for k in range(end - 1, i + chunk_size // 2 - 1, -1):
+                    if text[ends[k] - 1 - self._closing_run(text, ends[k])] in _SENTENCE_END_CHARS:
+                        end = k + 1
+                        break
+            spans.append((starts[i], ends[end - 1]))
+            if end >= word_count:
                 break
+            i = max(end - chunk_overlap, i + 1)
+        
+        return spans
+    
+    def _closing_run(self, text: str, end: int) -> int:
+        """Number of closing quotes/brackets right before end, e.g. the quote in 'harvest."'"""
+        run = 0
+        while run < end - 1 and text[end - 1 - run] in _CLOSING_CHARS:
+            run += 1
+        return run
+    
+    def chunk_settings(self) -> Dict[str, Any]:
+        """Parameters that determine the chunks; a change requires re-chunking every document"""
+        return {
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+            "chunk_by_sentence": CHUNK_BY_SENTENCE,
+            "tagger_version": TAGGER_VERSION
+        }
+    
+    def chunk_text(self, text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+        """Split text into overlapping chunks"""
+        return [text[start:end] for start, end in self.chunk_spans(text, chunk_size, chunk_overlap)]
+    
+    def embed_documents(self, documents: List[Dict[str, Any]]):
+        """Embed a batch of chunk records, reusing cached vectors for unchanged texts"""
+        return self.embedding_engine.embed_cached([doc['content'] for doc in documents])
+    
+    def compute_hash(self, content: str) -> str:
+        """Return a stable content hash for a chunk of text"""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    
+    def file_hash(self, file_path: str) -> str:
+        """Hash the raw bytes of a document on disk"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def list_documents(self, documents_dir: str = "./app/data/documents") -> List[str]:
+        """List supported document filenames in a stable order"""
+        if not os.path.exists(documents_dir):
+            return []
+        return sorted(
+            filename for filename in os.listdir(documents_dir)
+            if os.path.splitext(filename)[1].lower() in self.supported_formats
+        )
+    
+    def load_document(self, file_path: str) -> List[str]:
+        """Load the non-empty pages of a supported document"""
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if file_ext == '.pdf':
+            return self.load_pdf_document(file_path)
+        if file_ext == '.txt':
+            return self.load_text_document(file_path)
+        return []
+    
+    def iter_chunks(self, filename: str, pages: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Lazily chunk the loaded pages of a document into records with stable ids.
+        
+        start_char/end_char in the metadata are offsets into the page text (PDF) or
+        the whole file (.txt), so callers can slice the original lazily. 'terms' holds
+        the chunk's term frequencies for the BM25 inverted index. Crop and region tags
+        come from app.rag.metadata_tagger.
+        """
+        is_pdf = os.path.splitext(filename)[1].lower() == '.pdf'
+        
+        for page_num, page_text in enumerate(pages):
+            spans = self.chunk_spans(page_text)
+            for chunk_num, (start, end) in enumerate(spans):
+                chunk = page_text[start:end]
+                metadata = {'source': filename}
+                if is_pdf:
+                    doc_id = f"{filename}_page{page_num}_chunk{chunk_num}"
+                    metadata['page'] = page_num + 1
+                else:
+                    doc_id = f"{filename}_chunk{chunk_num}"
+                metadata['chunk'] = chunk_num + 1
+                metadata['start_char'] = start
+                metadata['end_char'] = end
+                metadata['type'] = 'agricultural_knowledge'
+                metadata.update(tag_metadata(chunk, filename))
                 
-        return chunks
+                yield {
+                    'id': doc_id,
+                    'content': chunk,
+                    # The tagger version is hashed too, so changed tag dictionaries re-tag on the next ingest
+                    'hash': self.compute_hash(f"{TAGGER_VERSION}:{chunk}"),
+                    'terms': term_frequencies(chunk),
+                    'metadata': metadata
+                }
+    
+    def chunk_document(self, filename: str, pages: List[str]) -> List[Dict[str, Any]]:
+        """Chunk the loaded pages of a document into records with stable ids"""
+        return list(self.iter_chunks(filename, pages))
+    
+    def process_file(self, file_path: str) -> List[Dict[str, Any]]:
+        """Load and chunk a single document"""
+        logger.info(f"Processing document: {os.path.basename(file_path)}")
+        return self.chunk_document(os.path.basename(file_path), self.load_document(file_path))
+    
+    def _submit_extraction(self, pool: ProcessPoolExecutor, file_path: str) -> Optional[List[Future]]:
+        """Queue the extraction of one document, splitting large PDFs into page ranges"""
+        try:
+            if file_path.lower().endswith('.pdf'):
+                page_count = _count_pdf_pages(file_path)
+                return [
+                    pool.submit(_extract_pdf_pages, file_path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+                    for start in range(0, page_count, PDF_PAGES_PER_TASK)
+                ]
+            return [pool.submit(_read_text_file, file_path)]
+        except Exception as e:
+            logger.error(f"Error loading document {file_path}: {str(e)}")
+            return None
+    
+    def _collect_extraction(self, file_path: str, futures: Optional[List[Future]]) -> Tuple[str, List[str]]:
+        """Wait for a queued extraction and return its non-empty pages in page order"""
+        if futures is None:
+            return file_path, []
+        
+        pages = []
+        try:
+            for future in futures:
+                pages.extend(future.result())
+        except Exception as e:
+            logger.error(f"Error loading document {file_path}: {str(e)}")
+            return file_path, []
+        
+        # Match the serial loaders: blank pages yield nothing
+        return file_path, [page for page in pages if page.strip()]
     
-    def process_documents(self, documents_dir: str = "./app/data/documents") -> List[Dict[str, Any]]:
+    def iter_pages_parallel(self, file_paths: Iterable[str], workers: int) -> Iterator[Tuple[str, List[str]]]:
+        """Extract documents across a process pool, yielding (file_path, pages) in input order.
+        
+        Only about two documents per worker are in flight at a time, so memory stays
+        bounded regardless of corpus size, and page order (and therefore chunk ids) is
+        identical to a serial run.
+        """
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_path in file_paths:
+                pending.append((file_path, self._submit_extraction(pool, file_path)))
+                if len(pending) >= workers * 2:
+                    yield self._collect_extraction(*pending.popleft())
+            while pending:
+                yield self._collect_extraction(*pending.popleft())
+    
+    def iter_processed_files(self, file_paths: Iterable[str], workers: Optional[int] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield (file_path, chunks) one document at a time; a bad file yields no chunks"""
+        workers = workers or INGEST_WORKERS
+        
+        if workers > 1:
+            loaded = self.iter_pages_parallel(file_paths, workers)
+        else:
+            loaded = ((file_path, self.load_document(file_path)) for file_path in file_paths)
+        
+        for file_path, pages in loaded:
+            filename = os.path.basename(file_path)
+            logger.info(f"Processing document: {filename}")
+            try:
+                yield file_path, self.chunk_document(filename, pages)
+            except Exception as e:
+                logger.error(f"Error chunking document {filename}: {str(e)}")
+                yield file_path, []
+    
+    def process_files(self, file_paths: List[str], workers: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Load and chunk several documents, in parallel when workers > 1"""
+        return dict(self.iter_processed_files(file_paths, workers))
+    
+    def iter_documents(self, documents_dir: str = "./app/data/documents", workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Lazily yield the chunks of every document in the directory"""
+        file_paths = [os.path.join(documents_dir, filename) for filename in self.list_documents(documents_dir)]
+        for _, documents in self.iter_processed_files(file_paths, workers):
+            yield from documents
+    
+    def process_documents(self, documents_dir: str = "./app/data/documents", workers: Optional[int] = None) -> List[Dict[str, Any]]:
         """Process all documents in the directory"""
         processed_documents = []
         
@@ -63,50 +287,10 @@ class DocumentProcessor:
             logger.warning(f"Documents directory {documents_dir} does not exist")
             return processed_documents
         
-        for filename in os.listdir(documents_dir):
-            file_path = os.path.join(documents_dir, filename)
-            file_ext = os.path.splitext(filename)[1].lower()
-            
-            if file_ext not in self.supported_formats:
-                continue
-                
-            logger.info(f"Processing document: {filename}")
-            
-            if file_ext == '.pdf':
-                pages = self.load_pdf_document(file_path)
-                for page_num, page_text in enumerate(pages):
-                    chunks = self.chunk_text(page_text)
-                    for chunk_num, chunk in enumerate(chunks):
-                        doc_id = f"{filename}_page{page_num}_chunk{chunk_num}"
-                        processed_documents.append({
-                            'id': doc_id,
-                            'content': chunk,
-                            'metadata': {
-                                'source': filename,
-                                'page': page_num + 1,
-                                'chunk': chunk_num + 1,
-                                'type': 'agricultural_knowledge'
-                            }
-                        })
-            
-            elif file_ext == '.txt':
-                content_chunks = self.load_text_document(file_path)
-                for chunk_num, chunk in enumerate(content_chunks):
-                    smaller_chunks = self.chunk_text(chunk)
-                    for sub_chunk_num, sub_chunk in enumerate(smaller_chunks):
-                        doc_id = f"{filename}_chunk{sub_chunk_num}"
-                        processed_documents.append({
-                            'id': doc_id,
-                            'content': sub_chunk,
-                            'metadata': {
-                                'source': filename,
-                                'chunk': sub_chunk_num + 1,
-                                'type': 'agricultural_knowledge'
-                            }
-                        })
+        processed_documents.extend(self.iter_documents(documents_dir, workers))
         
         logger.info(f"Processed {len(processed_documents)} document chunks")
         return processed_documents
 
 # Initialize document processor
-document_processor = DocumentProcessor()
\ No newline at end of file
+document_processor = DocumentProcessor()
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./app/data/embedding_cache")
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by a hash of (model name, chunk text).
+    
+    Vectors are appended to a float32 matrix file that is memory-mapped for reads,
+    and an append-only index file maps each key to its row. Rows are written before
+    their index lines, so an interrupted write leaves at most unreferenced rows.
+    Appends hold an exclusive flock on the index file, since the ingest CLI and the
+    server workers share these files.
+    """
+    
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        slug = re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.matrix_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.index_path = os.path.join(cache_dir, f"{slug}.index")
+        self.dimension: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def key(self, text: str) -> str:
+        """Cache key for a chunk of text under this model"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+    
+    def __len__(self) -> int:
+        self._load()
+        return len(self._rows)
+    
+    def _load(self):
+        """Read the index file once; the matrix itself is mapped lazily"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, 'r', encoding='utf-8') as file:
+                        if fcntl is not None:
+                            # Shared lock: never read an index another process is halfway through appending
+                            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+                        first_line = file.readline()
+                        if first_line:
+                            # Empty while another process creates it, before the header is written
+                            header = json.loads(first_line)
+                            self.dimension = header["dimension"]
+                        for line in file:
+                            parts = line.split()
+                            if len(parts) == 2:
+                                self._rows[parts[0]] = int(parts[1])
+                    # Drop index entries whose row never reached the matrix file, so later
+                    # appends cannot be mistaken for them
+                    stored_rows = self._stored_rows()
+                    valid_rows = {key: row for key, row in self._rows.items() if row < stored_rows}
+                    if len(valid_rows) != len(self._rows):
+                        self._rows = valid_rows
+                        self._rewrite_index()
+                    logger.info(f"Loaded embedding cache with {len(self._rows)} vectors from {self.cache_dir}")
+                except Exception as e:
+                    # It is only a cache: start over rather than append to a corrupt index
+                    logger.warning(f"Discarding unreadable embedding cache {self.index_path}: {str(e)}")
+                    for path in (self.index_path, self.matrix_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    self._rows = {}
+                    self.dimension = None
+            self._loaded = True
+    
+    def _rewrite_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({"model": self.model_name, "dimension": self.dimension}) + "\n")
+            for key, row in self._rows.items():
+                file.write(f"{key} {row}\n")
+        os.replace(tmp_path, self.index_path)
+    
+    def _stored_rows(self) -> int:
+        if not self.dimension or not os.path.exists(self.matrix_path):
+            return 0
+        return os.path.getsize(self.matrix_path) // (self.dimension * 4)
+    
+    @contextmanager
+    def _append_lock(self):
+        """Exclusive lock on the index file across processes, held while rows are appended"""
+        with open(self.index_path, 'a', encoding='utf-8') as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield file
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    
+    def _view(self, min_rows: int) -> np.memmap:
+        """Memory-map the matrix, remapping only when it has grown past the current view"""
+        if self._matrix is None or self._matrix.shape[0] < min_rows:
+            self._matrix = np.memmap(
+                self.matrix_path, dtype=np.float32, mode='r',
+                shape=(self._stored_rows(), self.dimension)
+            )
+        return self._matrix
+    
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached vector for each text, or None where it is not cached"""
+        self._load()
+        rows = [self._rows.get(self.key(text)) for text in texts]
+        found = [row for row in rows if row is not None]
+        if not found:
+            return [None] * len(texts)
+            
+        with self._lock:
+            matrix = self._view(max(found) + 1)
+        return [np.array(matrix[row]) if row is not None else None for row in rows]
+    
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """Append vectors for texts that are not cached yet"""
+        self._load()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(embeddings.shape[1])
+            elif embeddings.shape[1] != self.dimension:
+                logger.warning(f"Not caching {embeddings.shape[1]}-dim vectors in a {self.dimension}-dim cache")
+                return
+                
+            new_items = {}
+            for text, vector in zip(texts, embeddings):
+                key = self.key(text)
+                if key not in self._rows and key not in new_items:
+                    new_items[key] = vector
+            if not new_items:
+                return
+                
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._append_lock() as index_file:
+                # Read under the lock: another process may have appended since this one loaded
+                write_header = os.fstat(index_file.fileno()).st_size == 0
+                first_row = self._stored_rows()
+                
+                with open(self.matrix_path, 'ab') as file:
+                    file.write(np.vstack(list(new_items.values())).tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+                
+                if write_header:
+                    index_file.write(json.dumps({"model": self.model_name, "dimension": self.dimension}) + "\n")
+                for offset, key in enumerate(new_items):
+                    index_file.write(f"{key} {first_row + offset}\n")
+                # Flushed before the lock is released, so the next appender sees the complete index
+                index_file.flush()
+            
+            for offset, key in enumerate(new_items):
+                self._rows[key] = first_row + offset
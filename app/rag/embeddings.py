@@ -0,0 +1,137 @@
+import os
+import logging
+import threading
+from typing import List
+import numpy as np
+from app.rag.embedding_cache import EmbeddingCache
+from app.rag.query_cache import LRUCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+class EmbeddingEngine:
+    """Single SentenceTransformer shared by ingestion and search, loaded on first use"""
+    
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = EmbeddingCache(model_name)
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.encoded_texts = 0
+        self._model = None
+        self._loader = None
+        self._lock = threading.Lock()
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+    
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded the first time it is needed"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Imported here: sentence_transformers pulls in torch, which is slow to import
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(self.model_name)
+                    logger.info(f"Loaded embedding model {self.model_name} ({model.get_sentence_embedding_dimension()} dims)")
+                    self._model = model
+        return self._model
+    
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+    
+    def load(self):
+        """Load the model eagerly, e.g. from a warm-up task"""
+        return self.model
+    
+    def load_in_background(self):
+        """Start loading the model on a daemon thread unless it is loaded or already loading"""
+        with self._lock:
+            if self._model is not None or self._loader is not None:
+                return
+            self._loader = threading.Thread(target=self.load, name="embedding-model-loader", daemon=True)
+        self._loader.start()
+    
+    def embed(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """Encode texts in batches into an (n, dim) array of L2-normalized float32 vectors"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+            
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        with self._lock:
+            self.encoded_texts += len(texts)
+        return embeddings.astype(np.float32, copy=False)
+    
+    def embed_cached(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        """Embed texts, reusing vectors from the on-disk cache and only encoding the misses"""
+        if not texts:
+            return self.embed(texts)
+        
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embed([texts[i] for i in missing], batch_size)
+            self.cache.put_many([texts[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return np.vstack(vectors).astype(np.float32, copy=False)
+    
+    def embed_memoized(self, texts: List[str], cache: LRUCache) -> np.ndarray:
+        """Embed texts through an in-memory LRU keyed by text; for the request path, which must not write to disk"""
+        vectors = [cache.get(text) for text in texts]
+        missing = sorted({text for text, vector in zip(texts, vectors) if vector is None})
+        if missing:
+            fresh = dict(zip(missing, self.embed(missing)))
+            for text, embedding in fresh.items():
+                embedding.setflags(write=False)
+                cache.put(text, embedding)
+            vectors = [vector if vector is not None else fresh[text] for text, vector in zip(texts, vectors)]
+        if not vectors:
+            return self.embed([])
+        return np.vstack(vectors)
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Encode a single query into a normalized float32 vector, memoized in an LRU cache.
+        
+        Queries differing only in case or spacing share a vector; the default model is uncased.
+        """
+        key = normalize_query(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.embed([key])[0]
+            embedding.setflags(write=False)
+            self.query_cache.put(key, embedding)
+        return embedding
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode several queries in one batch, reusing memoized query vectors"""
+        keys = [normalize_query(query) for query in queries]
+        vectors = [self.query_cache.get(key) for key in keys]
+        missing = sorted({key for key, vector in zip(keys, vectors) if vector is None})
+        if missing:
+            fresh = dict(zip(missing, self.embed(missing)))
+            for key, embedding in fresh.items():
+                embedding.setflags(write=False)
+                self.query_cache.put(key, embedding)
+            vectors = [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+        if not vectors:
+            return self.embed([])
+        return np.vstack(vectors)
+
+# Initialize the shared embedding engine
+embedding_engine = EmbeddingEngine()
@@ -0,0 +1,80 @@
+import os
+import re
+import shutil
+import sqlite3
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_FILENAME = "chroma.sqlite3"
+_SEGMENT_DIR_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+def path_size(path: str) -> int:
+    """Bytes used by a file, or by every file under a directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+def live_segment_ids(persistence_dir: str) -> set:
+    """Ids of the segments Chroma's catalog still references (read-only connection)"""
+    db_path = os.path.abspath(os.path.join(persistence_dir, CHROMA_DB_FILENAME))
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return {row[0] for row in connection.execute("SELECT id FROM segments")}
+    finally:
+        connection.close()
+
+def find_orphaned_segments(persistence_dir: str) -> List[str]:
+    """Segment directories (named by segment UUID) that no live collection references"""
+    live = live_segment_ids(persistence_dir)
+    return sorted(
+        name for name in os.listdir(persistence_dir)
+        if _SEGMENT_DIR_PATTERN.match(name) and name not in live
+        and os.path.isdir(os.path.join(persistence_dir, name))
+    )
+
+def vacuum(persistence_dir: str):
+    """Rebuild chroma.sqlite3 without its free pages"""
+    connection = sqlite3.connect(os.path.join(persistence_dir, CHROMA_DB_FILENAME), timeout=30)
+    try:
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+def compact_store(persistence_dir: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Delete orphaned HNSW segment directories, vacuum the catalog and report the bytes reclaimed.
+    
+    Nothing is removed unless the catalog could be read, so a missing or locked
+    database never makes live segments look orphaned.
+    """
+    db_path = os.path.join(persistence_dir, CHROMA_DB_FILENAME)
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"No Chroma database at {db_path}")
+    
+    orphans = find_orphaned_segments(persistence_dir)
+    segment_bytes = sum(path_size(os.path.join(persistence_dir, name)) for name in orphans)
+    sqlite_before = path_size(db_path)
+    report = {
+        "dry_run": dry_run,
+        "orphaned_segments": orphans,
+        "segment_bytes": segment_bytes,
+        "sqlite_bytes_before": sqlite_before,
+        "sqlite_bytes_after": sqlite_before,
+        "bytes_reclaimed": 0
+    }
+    if dry_run:
+        return report
+    
+    for name in orphans:
+        shutil.rmtree(os.path.join(persistence_dir, name))
+        logger.info(f"Removed orphaned segment {name}")
+    vacuum(persistence_dir)
+    report["sqlite_bytes_after"] = path_size(db_path)
+    report["bytes_reclaimed"] = segment_bytes + sqlite_before - report["sqlite_bytes_after"]
+    logger.info(f"Compacted {persistence_dir}: {len(orphans)} orphaned segments removed, "
+                f"{report['bytes_reclaimed']} bytes reclaimed")
+    return report
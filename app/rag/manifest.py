@@ -0,0 +1,97 @@
+import json
+import os
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+class IngestManifest:
+    """Per-file and per-chunk content hashes of what is stored in the collection,
+    plus the settings (embedding model, chunking parameters) it was built with"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.settings: Dict[str, Any] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+    
+    @classmethod
+    def load(cls, directory: str) -> "IngestManifest":
+        """Load the manifest stored in directory, or return an empty one"""
+        manifest = cls(os.path.join(directory, MANIFEST_FILENAME))
+        if not os.path.exists(manifest.path):
+            return manifest
+            
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            manifest.settings = data.get("settings", {})
+            manifest.files = data.get("files", {})
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest {manifest.path}: {str(e)}")
+        return manifest
+    
+    def save(self):
+        """Write the manifest atomically so a crash never leaves half a file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                "settings": self.settings,
+                "chunk_count": self.indexed_count(),
+                "files": self.files
+            }, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+    
+    def file_hash(self, filename: str) -> Optional[str]:
+        """Return the recorded content hash of a source file"""
+        entry = self.files.get(filename)
+        return entry["hash"] if entry else None
+    
+    def chunk_hashes(self, filename: str) -> Dict[str, str]:
+        """Return the recorded chunk id -> chunk hash mapping of a source file"""
+        entry = self.files.get(filename)
+        return dict(entry["chunks"]) if entry else {}
+    
+    def duplicates(self, filename: str) -> Dict[str, str]:
+        """Return the chunk id -> kept chunk id mapping of a file's near-duplicate chunks"""
+        entry = self.files.get(filename)
+        return dict(entry.get("duplicates", {})) if entry else {}
+    
+    def indexed_ids(self, filename: str) -> List[str]:
+        """Chunk ids of a file that are stored in the collection (i.e. not near-duplicates)"""
+        duplicates = self.duplicates(filename)
+        return [chunk_id for chunk_id in self.chunk_hashes(filename) if chunk_id not in duplicates]
+    
+    def update_file(self, filename: str, file_hash: str, chunk_hashes: Dict[str, str],
+                    duplicates: Optional[Dict[str, str]] = None):
+        """Record the current hashes of a source file and its chunks"""
+        self.files[filename] = {"hash": file_hash, "chunks": chunk_hashes}
+        if duplicates:
+            self.files[filename]["duplicates"] = duplicates
+    
+    def remove_file(self, filename: str):
+        """Forget a source file that no longer exists"""
+        self.files.pop(filename, None)
+    
+    def clear(self):
+        """Forget every file, e.g. after the collection was dropped"""
+        self.files = {}
+    
+    def matches(self, settings: Dict[str, Any]) -> bool:
+        """Whether the recorded chunks were built with these settings"""
+        return self.settings == settings
+    
+    def fingerprint(self) -> str:
+        """Hash of the recorded state, used to tell whether derived indexes are current"""
+        state = {"settings": self.settings, "files": self.files}
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def chunk_count(self) -> int:
+        """Total number of chunks recorded across all files"""
+        return sum(len(entry["chunks"]) for entry in self.files.values())
+    
+    def indexed_count(self) -> int:
+        """Number of chunks stored in the collection (near-duplicates excluded)"""
+        return sum(len(self.indexed_ids(filename)) for filename in self.files)
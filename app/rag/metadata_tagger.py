@@ -0,0 +1,108 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Bump when the dictionaries change so ingest re-tags every chunk
+TAGGER_VERSION = "1"
+
+GENERAL_CROP = "general"
+ALL_REGIONS = "all"
+
+CROP_TERMS = {
+    "maize": ["maize", "corn"],
+    "wheat": ["wheat"],
+    "teff": ["teff", "tef"],
+    "sorghum": ["sorghum"],
+    "barley": ["barley"],
+    "millet": ["millet", "finger millet"],
+    "rice": ["rice"],
+    "coffee": ["coffee"],
+    "enset": ["enset", "false banana"],
+    "haricot_bean": ["haricot bean", "haricot beans", "common bean", "common beans"],
+    "faba_bean": ["faba bean", "faba beans", "broad bean", "broad beans"],
+    "chickpea": ["chickpea", "chickpeas"],
+    "potato": ["potato", "potatoes"],
+    "sesame": ["sesame"],
+    "tomato": ["tomato", "tomatoes"],
+    "onion": ["onion", "onions"]
+}
+
+# Regional states of Ethiopia, with a few major towns that farmers give as their location
+REGION_TERMS = {
+    "tigray": ["tigray", "mekelle", "axum", "adigrat"],
+    "afar": ["afar", "semera"],
+    "amhara": ["amhara", "bahir dar", "gondar", "dessie", "debre markos"],
+    "oromia": ["oromia", "adama", "nazret", "jimma", "bishoftu", "shashemene", "nekemte", "bale", "arsi"],
+    "somali": ["somali region", "jijiga"],
+    "benishangul_gumuz": ["benishangul", "gumuz", "assosa"],
+    "gambela": ["gambela", "gambella"],
+    "harari": ["harari", "harar"],
+    "sidama": ["sidama", "hawassa", "awassa"],
+    "central_ethiopia": ["central ethiopia", "hosaena", "hossana", "butajira", "wolkite"],
+    "south_ethiopia": ["south ethiopia", "southern ethiopia", "snnp", "snnpr", "wolaita", "arba minch"],
+    "south_west_ethiopia": ["south west ethiopia", "southwest ethiopia", "bonga", "mizan"],
+    "addis_ababa": ["addis ababa", "addis abeba", "finfinne"],
+    "dire_dawa": ["dire dawa"]
+}
+
+def _compile(terms: Dict[str, List[str]]):
+    return [
+        (name, re.compile(r'\b(?:' + '|'.join(re.escape(alias) for alias in aliases) + r')\b', re.IGNORECASE))
+        for name, aliases in terms.items()
+    ]
+
+_CROP_PATTERNS = _compile(CROP_TERMS)
+_REGION_PATTERNS = _compile(REGION_TERMS)
+
+def _detect(patterns, text: str) -> List[str]:
+    """Names mentioned in the text, most frequent first"""
+    counts = Counter({name: len(pattern.findall(text)) for name, pattern in patterns})
+    return [name for name, count in counts.most_common() if count]
+
+def detect_crops(text: str) -> List[str]:
+    return _detect(_CROP_PATTERNS, text or "")
+
+def detect_regions(text: str) -> List[str]:
+    return _detect(_REGION_PATTERNS, text or "")
+
+def tag_metadata(text: str, filename: str = "") -> Dict[str, Any]:
+    """Crop and region tags for a chunk, from its text and its document's filename.
+    
+    Chroma metadata values must be scalars, so besides the primary 'crop'/'region'
+    every detected name gets a boolean flag such as crop_maize or region_oromia.
+    Chunks that name no crop (region) are tagged "general" ("all") and match any filter.
+    """
+    name_hint = filename.replace('_', ' ').replace('-', ' ')
+    crops = detect_crops(text)
+    crops += [crop for crop in detect_crops(name_hint) if crop not in crops]
+    regions = detect_regions(text)
+    regions += [region for region in detect_regions(name_hint) if region not in regions]
+    
+    metadata: Dict[str, Any] = {
+        'crop': crops[0] if crops else GENERAL_CROP,
+        'region': regions[0] if regions else ALL_REGIONS
+    }
+    for crop in crops:
+        metadata[f'crop_{crop}'] = True
+    for region in regions:
+        metadata[f'region_{region}'] = True
+    return metadata
+
+def build_filter(crop_type: Optional[str] = None, location: Optional[str] = None, query: str = "") -> Optional[Dict[str, Any]]:
+    """Chroma where filter restricting retrieval to the asked crop(s) and region plus general chunks.
+    
+    Crops named in the query are added to crop_type, so a wheat question still finds
+    wheat chunks when the request's crop_type is left at its default.
+    """
+    crops = detect_crops(crop_type or "")
+    crops += [crop for crop in detect_crops(query) if crop not in crops]
+    regions = detect_regions(location or "")
+    
+    clauses = []
+    if crops:
+        clauses.append({"$or": [{f"crop_{crop}": True} for crop in crops] + [{"crop": GENERAL_CROP}]})
+    if regions:
+        clauses.append({"$or": [{f"region_{regions[0]}": True}, {"region": ALL_REGIONS}]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -1,10 +1,21 @@
+import re
 import logging
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.rag.vector_store import vector_store
+from app.rag.retrieval_executor import retrieval_executor, RetrievalQueueFull
+from app.rag.metadata_tagger import build_filter
+from app.rag.context_builder import CONTEXT_CANDIDATES, context_builder
 
 logger = logging.getLogger(__name__)
 
+# Split points of compound questions: sentence/clause breaks, and "and"/"also" before a new question
+_SUB_QUERY_SPLIT = re.compile(
+    r'[?;\n]|\balso\b|\band\s+(?=(?:how|what|when|where|which|why|should|can|do|does|is|are)\b)',
+    re.IGNORECASE
+)
+MIN_SUB_QUERY_WORDS = 3
+
 class RAGManager:
     def __init__(self):
         self.vector_store = vector_store
@@ -20,41 +31,165 @@ class RAGManager:
             self.initialized = False
             return False
     
-    def get_agricultural_context(self, query: str, max_results: int = 3) -> str:
-        """Get relevant agricultural context for a query"""
+    def restore(self) -> bool:
+        """Mark the knowledge base initialized from its persisted manifest (no document processing)"""
+        try:
+            self.initialized = self.vector_store.restore()
+            return self.initialized
+        except Exception as e:
+            logger.error(f"Error restoring knowledge base: {str(e)}")
+            return False
+    
+    def load_snapshot(self, archive_path: str) -> bool:
+        """Serve a prebuilt knowledge base snapshot, falling back to the persisted manifest"""
+        try:
+            self.initialized = self.vector_store.load_snapshot(archive_path)
+            return self.initialized
+        except Exception as e:
+            logger.error(f"Error loading knowledge base snapshot {archive_path}: {str(e)}")
+            return self.restore()
+    
+    def warm_up(self) -> bool:
+        """Load the embedding model and open the vector store before the first request"""
+        try:
+            self.vector_store.warm_up()
+            return True
+        except Exception as e:
+            logger.error(f"Error warming up RAG components: {str(e)}")
+            return False
+    
+    def is_ready(self) -> bool:
+        """Whether the heavy RAG resources are loaded and usable"""
+        return self.vector_store.is_ready
+    
+    def split_query(self, query: str) -> List[str]:
+        """Break a compound farmer question into sub-queries, such as planting time plus pest control"""
+        parts = [part.strip(" ,.") for part in _SUB_QUERY_SPLIT.split(query)]
+        parts = [part for part in parts if len(part.split()) >= MIN_SUB_QUERY_WORDS]
+        return parts if len(parts) > 1 else [query]
+    
+    def _merge_results(self, results_per_query: List[List[Dict[str, Any]]], max_results: int) -> List[Dict[str, Any]]:
+        """Interleave sub-query results so each sub-question is covered, dropping repeated chunks"""
+        merged, seen = [], set()
+        for position in range(max(map(len, results_per_query), default=0)):
+            for results in results_per_query:
+                if position < len(results) and len(merged) < max_results:
+                    result = results[position]
+                    key = (result['metadata'].get('source'), result['content'])
+                    if key not in seen:
+                        seen.add(key)
+                        merged.append(result)
+        for rank, result in enumerate(merged, 1):
+            result['rank'] = rank
+        return merged
+    
+    def _no_context(self, message: str) -> Dict[str, Any]:
+        """Fallback context when retrieval is unavailable; 'fallback' lets callers tell it from real knowledge"""
+        return {"context": message, "sources": [], "tokens": 0, "original_tokens": 0, "token_budget": 0, "fallback": True}
+    
+    def _ensure_initialized(self) -> bool:
+        if self.initialized and not self.vector_store.is_initialized:
+            # warm_up found the restored manifest stale
+            self.initialized = False
+        if not self.initialized and not self.restore():
+            # Try to initialize if not done
+            self.initialize_knowledge_base()
+        return self.initialized
+    
+    def _search(self, query: str, max_results: int, filter_metadata: Optional[Dict]) -> List[Dict[str, Any]]:
+        # Compound questions are answered with one batched search over their parts
+        sub_queries = self.split_query(query)
+        if len(sub_queries) > 1:
+            results_per_query = self.vector_store.search_many(sub_queries, n_results=max_results, filter_metadata=filter_metadata)
+            return self._merge_results(results_per_query, max_results)
+        return self.vector_store.search(query, n_results=max_results, filter_metadata=filter_metadata)
+    
+    def build_context(self, query: str, token_budget: Optional[int] = None, max_results: Optional[int] = None,
+                      crop_type: Optional[str] = None, location: Optional[str] = None,
+                      compression_ratio: Optional[float] = None) -> Dict[str, Any]:
+        """Prompt context packed to a token budget, with the sources it was built from.
+        
+        Retrieves CONTEXT_CANDIDATES chunks pre-filtered to the farmer's crop and region and
+        packs them in MMR order; max_results optionally caps the number of chunks and
+        compression_ratio overrides COMPRESSION_RATIO.
+        """
         try:
-            if not self.initialized:
-                # Try to initialize if not done
-                self.initialize_knowledge_base()
-                if not self.initialized:
-                    return "Knowledge base not yet initialized. Using general AI knowledge."
+            if not self._ensure_initialized():
+                return self._no_context("Knowledge base not yet initialized. Using general AI knowledge.")
             
-            # Search for relevant documents
-            results = self.vector_store.search(query, n_results=max_results)
+            filter_metadata = build_filter(crop_type, location, query)
+            results = self._search(query, CONTEXT_CANDIDATES, filter_metadata)
+            if not results and filter_metadata:
+                # Nothing tagged for this crop/region yet
+                results = self._search(query, CONTEXT_CANDIDATES, None)
             
-            if not results:
-                return "No specific agricultural knowledge found for this query. Relying on general knowledge."
+            packed = context_builder.build(query, results, token_budget, max_results, compression_ratio)
+            logger.info(f"Packed {len(packed['sources'])} of {len(results)} chunks "
+                        f"({packed['tokens']}/{packed['token_budget']} tokens, {packed['original_tokens']} "
+                        f"before compression) for query: {query}")
+            return packed
             
-            # Format context from results
-            context_parts = []
-            for result in results:
-                source_info = result['metadata']['source']
-                content = result['content']
-                relevance = result.get('relevance_score', 0.8)
-                
-                # Limit content length to avoid huge prompts
-                if len(content) > 500:
-                    content = content[:500] + "..."
-                
-                context_parts.append(f"From {source_info} (relevance: {relevance:.2f}): {content}")
+        except Exception as e:
+            logger.error(f"Error getting agricultural context: {str(e)}")
+            return self._no_context("Error retrieving agricultural knowledge. Using general knowledge base.")
+    
+    def get_agricultural_context(self, query: str, max_results: Optional[int] = None, crop_type: Optional[str] = None,
+                                 location: Optional[str] = None, token_budget: Optional[int] = None) -> str:
+        """Get relevant agricultural context for a query, pre-filtered to the farmer's crop and region"""
+        return self.build_context(query, token_budget, max_results, crop_type, location)["context"]
+    
+    def get_agricultural_contexts(self, queries: List[str], max_results: Optional[int] = None,
+                                  token_budget: Optional[int] = None) -> List[str]:
+        """Get context for many queries (e.g. bulk advisory jobs) with a single batched search"""
+        try:
+            if not self._ensure_initialized():
+                return ["Knowledge base not yet initialized. Using general AI knowledge."] * len(queries)
             
-            context = "\n\n".join(context_parts)
-            logger.info(f"Retrieved {len(results)} context chunks for query: {query}")
-            return context
+            results_per_query = self.vector_store.search_many(queries, n_results=CONTEXT_CANDIDATES)
+            logger.info(f"Retrieved context for {len(queries)} queries in one batch")
+            return [
+                context_builder.build(query, results, token_budget, max_results)["context"]
+                for query, results in zip(queries, results_per_query)
+            ]
             
         except Exception as e:
-            logger.error(f"Error getting agricultural context: {str(e)}")
-            return "Error retrieving agricultural knowledge. Using general knowledge base."
+            logger.error(f"Error getting agricultural contexts: {str(e)}")
+            return ["Error retrieving agricultural knowledge. Using general knowledge base."] * len(queries)
+    
+    async def build_context_async(self, query: str, token_budget: Optional[int] = None, max_results: Optional[int] = None,
+                                  crop_type: Optional[str] = None, location: Optional[str] = None,
+                                  compression_ratio: Optional[float] = None) -> Dict[str, Any]:
+        """Non-blocking build_context for async endpoints"""
+        try:
+            return await retrieval_executor.run(
+                self.build_context, query, token_budget, max_results, crop_type, location, compression_ratio
+            )
+        except RetrievalQueueFull as e:
+            logger.warning(f"Retrieval queue full, answering without context: {str(e)}")
+            return self._no_context("Knowledge base is busy. Using general knowledge base.")
+    
+    async def get_agricultural_context_async(self, query: str, max_results: Optional[int] = None, crop_type: Optional[str] = None,
+                                             location: Optional[str] = None, token_budget: Optional[int] = None) -> str:
+        """Non-blocking get_agricultural_context for async endpoints"""
+        packed = await self.build_context_async(query, token_budget, max_results, crop_type, location)
+        return packed["context"]
+    
+    async def get_agricultural_contexts_async(self, queries: List[str], max_results: Optional[int] = None,
+                                              token_budget: Optional[int] = None) -> List[str]:
+        """Non-blocking get_agricultural_contexts for async endpoints"""
+        try:
+            return await retrieval_executor.run(self.get_agricultural_contexts, queries, max_results, token_budget)
+        except RetrievalQueueFull as e:
+            logger.warning(f"Retrieval queue full, answering without context: {str(e)}")
+            return ["Knowledge base is busy. Using general knowledge base."] * len(queries)
+    
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """Queue depth and latency of the retrieval executor"""
+        return retrieval_executor.stats()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Retrieval cache counters for monitoring"""
+        return self.vector_store.get_cache_stats()
     
     def get_knowledge_base_status(self) -> Dict[str, Any]:
         """Get status of the knowledge base"""
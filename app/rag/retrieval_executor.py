@@ -0,0 +1,98 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "4"))
+RETRIEVAL_MAX_QUEUE = int(os.getenv("RETRIEVAL_MAX_QUEUE", "64"))
+
+class RetrievalQueueFull(RuntimeError):
+    """Raised when more retrievals are waiting than RETRIEVAL_MAX_QUEUE allows"""
+
+class RetrievalExecutor:
+    """Bounded thread pool that runs blocking retrieval work off the event loop"""
+    
+    def __init__(self, max_workers: int = RETRIEVAL_CONCURRENCY, max_queue: int = RETRIEVAL_MAX_QUEUE):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queued = 0
+        self.running = 0
+        self.peak_queue_depth = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="retrieval")
+        return self._executor
+    
+    def _run(self, func: Callable, args, kwargs, submitted_at: float):
+        started_at = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait_seconds += started_at - submitted_at
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_seconds += time.monotonic() - started_at
+    
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Await func(*args, **kwargs) on a pool thread; at most max_workers run at once"""
+        with self._lock:
+            if self.max_queue > 0 and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise RetrievalQueueFull(f"{self.queued} retrievals already waiting")
+            self.submitted += 1
+            self.queued += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._run, func, args, kwargs, time.monotonic())
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "peak_queue_depth": self.peak_queue_depth,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self.total_wait_seconds / self.completed, 2) if self.completed else 0.0,
+                "avg_run_ms": round(1000 * self.total_run_seconds / self.completed, 2) if self.completed else 0.0
+            }
+    
+    def shutdown(self):
+        """Stop the worker threads; a later call to run() starts a fresh pool"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("Retrieval executor shut down")
+
+# Shared by the vector store and the RAG manager
+retrieval_executor = RetrievalExecutor()
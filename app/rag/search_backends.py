@@ -0,0 +1,522 @@
+import os
+import json
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from app.rag.maintenance import path_size
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "chroma")
+EXPORT_PAGE_SIZE = 1000
+MASK_MAX_CARDINALITY = 256
+# Quantized index: PCA target dimension (0 keeps every dimension), candidates rescored per result, recall sample size
+QUANTIZED_PCA_DIM = int(os.getenv("QUANTIZED_PCA_DIM", "0"))
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "10"))
+RECALL_SAMPLE_QUERIES = int(os.getenv("RECALL_SAMPLE_QUERIES", "200"))
+PCA_FIT_SAMPLE = 20000
+SCORE_BLOCK_ROWS = 65536
+
+# One hit per result: (id, document, metadata, distance); distance is squared L2 like Chroma's default
+Hit = Tuple[str, str, Dict[str, Any], float]
+
+class ChromaSearchBackend:
+    """Approximate search through Chroma's HNSW index"""
+    
+    name = "chroma"
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def refresh(self):
+        """Chroma is the source of truth, nothing to rebuild"""
+    
+    def info(self) -> Dict[str, Any]:
+        return {"name": self.name}
+    
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        results = self.store.collection.query(
+            query_embeddings=query_embeddings.tolist(),
+            n_results=n_results,
+            where=where
+        )
+        
+        hits = []
+        for i, documents in enumerate(results['documents'] or []):
+            distances = results['distances'][i] if results['distances'] else [1.0] * len(documents)
+            hits.append(list(zip(results['ids'][i], documents, results['metadatas'][i], distances)))
+        return hits or [[] for _ in range(len(query_embeddings))]
+
+class NumpyIndex:
+    """Exact cosine index over a memory-mapped float32 matrix of normalized embeddings"""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.matrix_path = os.path.join(directory, "embeddings.f32")
+        self.records_path = os.path.join(directory, "records.json")
+        self.version: Optional[str] = None
+        self.dimension = 0
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.matrix: Optional[np.ndarray] = None
+        self._value_masks: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._filter_masks: Dict[str, np.ndarray] = {}
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def load(self) -> bool:
+        """Map the stored index; returns False if there is none or it is inconsistent"""
+        if not os.path.exists(self.records_path) or not os.path.exists(self.matrix_path):
+            return False
+        try:
+            records = self._read_records()
+            count, dimension = records["count"], records["dimension"]
+            if count and os.path.getsize(self.matrix_path) != count * dimension * 4:
+                logger.warning(f"Numpy index at {self.directory} is inconsistent, ignoring it")
+                return False
+                
+            self.matrix = (
+                np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(count, dimension))
+                if count else np.zeros((0, dimension), dtype=np.float32)
+            )
+            self._precompute_masks()
+            logger.info(f"Loaded numpy index with {count} vectors from {self.directory}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading numpy index: {str(e)}")
+            return False
+    
+    def _read_records(self) -> Dict[str, Any]:
+        with open(self.records_path, 'r', encoding='utf-8') as file:
+            records = json.load(file)
+        self.version = records.get("version")
+        self.dimension = records["dimension"]
+        self.ids = records["ids"]
+        self.documents = records.get("documents", [])
+        self.metadatas = records["metadatas"]
+        return records
+    
+    def _write_records(self, version: Optional[str], ids: List[str], dimension: int,
+                       metadatas: List[Dict[str, Any]], documents: Optional[List[str]] = None) -> str:
+        """Write the records file next to its final path; the caller moves it into place"""
+        tmp_records_path = f"{self.records_path}.tmp"
+        records = {"version": version, "count": len(ids), "dimension": dimension, "ids": ids}
+        if documents is not None:
+            records["documents"] = documents
+        records["metadatas"] = metadatas
+        with open(tmp_records_path, 'w', encoding='utf-8') as file:
+            json.dump(records, file)
+        return tmp_records_path
+    
+    def build(self, collection, version: Optional[str] = None):
+        """Export every record of a Chroma collection into the index files"""
+        self._export(collection, version)
+        self.load()
+    
+    def _export(self, collection, version: Optional[str], with_documents: bool = True):
+        os.makedirs(self.directory, exist_ok=True)
+        ids, documents, metadatas = [], [], []
+        dimension = 0
+        
+        tmp_matrix_path = f"{self.matrix_path}.tmp"
+        with open(tmp_matrix_path, 'wb') as matrix_file:
+            offset = 0
+            while True:
+                page = collection.get(
+                    include=["embeddings", "metadatas", *(["documents"] if with_documents else [])],
+                    limit=EXPORT_PAGE_SIZE,
+                    offset=offset
+                )
+                if not page['ids']:
+                    break
+                embeddings = np.asarray(page['embeddings'], dtype=np.float32)
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                embeddings = embeddings / np.where(norms == 0, 1, norms)
+                dimension = embeddings.shape[1]
+                matrix_file.write(embeddings.tobytes())
+                
+                ids.extend(page['ids'])
+                if with_documents:
+                    documents.extend(page['documents'])
+                metadatas.extend(page['metadatas'])
+                offset += len(page['ids'])
+                
+        tmp_records_path = self._write_records(version, ids, dimension, metadatas, documents if with_documents else None)
+        
+        # Drop the old mapping before replacing the file underneath it
+        self.matrix = None
+        os.replace(tmp_matrix_path, self.matrix_path)
+        os.replace(tmp_records_path, self.records_path)
+        logger.info(f"Exported {len(ids)} vectors to {self.directory}")
+    
+    def _precompute_masks(self):
+        """Boolean row masks for every value of low-cardinality metadata fields"""
+        self._filter_masks = {}
+        columns: Dict[str, Dict[Any, List[int]]] = {}
+        for row, metadata in enumerate(self.metadatas):
+            for field, value in (metadata or {}).items():
+                columns.setdefault(field, {}).setdefault(value, []).append(row)
+                
+        self._value_masks = {}
+        for field, values in columns.items():
+            if len(values) > MASK_MAX_CARDINALITY:
+                continue
+            masks = {}
+            for value, rows in values.items():
+                mask = np.zeros(len(self.ids), dtype=bool)
+                mask[rows] = True
+                masks[value] = mask
+            self._value_masks[field] = masks
+    
+    def _value_mask(self, field: str, value: Any) -> np.ndarray:
+        masks = self._value_masks.get(field)
+        if masks is not None:
+            mask = masks.get(value)
+            return mask if mask is not None else np.zeros(len(self.ids), dtype=bool)
+        return np.array([(metadata or {}).get(field) == value for metadata in self.metadatas], dtype=bool)
+    
+    def _condition_mask(self, field: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return self._value_mask(field, condition)
+            
+        mask = np.ones(len(self.ids), dtype=bool)
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                mask &= self._value_mask(field, operand)
+            elif operator == "$ne":
+                mask &= ~self._value_mask(field, operand)
+            elif operator == "$in":
+                mask &= np.logical_or.reduce([self._value_mask(field, value) for value in operand]) if operand else False
+            elif operator == "$nin":
+                for value in operand:
+                    mask &= ~self._value_mask(field, value)
+            else:
+                raise ValueError(f"Unsupported filter operator {operator}")
+        return mask
+    
+    def filter_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        """Row mask for a Chroma-style where filter, cached per distinct filter"""
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._filter_masks.get(key)
+        if mask is not None:
+            return mask
+            
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, condition in where.items():
+            if field == "$and":
+                for clause in condition:
+                    mask &= self.filter_mask(clause)
+            elif field == "$or":
+                mask &= np.logical_or.reduce([self.filter_mask(clause) for clause in condition])
+            else:
+                mask &= self._condition_mask(field, condition)
+                
+        self._filter_masks[key] = mask
+        return mask
+    
+    def info(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self.ids),
+            "float32_bytes": os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        }
+    
+    def search(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        """Exact top-k by cosine similarity: one matrix product plus argpartition"""
+        if not len(self.ids):
+            return [[] for _ in range(len(query_embeddings))]
+            
+        scores = np.asarray(query_embeddings, dtype=np.float32) @ self.matrix.T
+        if where:
+            scores[:, ~self.filter_mask(where)] = -np.inf
+            
+        k = min(n_results, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        
+        hits = []
+        for query_scores, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-query_scores[candidates], kind='stable')]
+            hits.append([
+                (self.ids[row], self.documents[row], self.metadatas[row], float(2.0 - 2.0 * query_scores[row]))
+                for row in ranked if np.isfinite(query_scores[row])
+            ])
+        return hits
+
+class NumpySearchBackend:
+    """Exact search over a memory-mapped export of the collection, rebuilt after each ingest"""
+    
+    name = "numpy"
+    
+    def __init__(self, store):
+        self.store = store
+        self.index = NumpyIndex(os.path.join(store.persistence_dir, "numpy_index"))
+        self._loaded = False
+        self._lock = threading.Lock()
+    
+    def refresh(self):
+        """Rebuild the export unless it already matches the current manifest"""
+        with self._lock:
+            version = self.store.manifest.fingerprint()
+            if not self._loaded:
+                self._loaded = self.index.load()
+            if self._loaded and self.index.version == version:
+                return
+            self.index.build(self.store.collection, version)
+            self._loaded = True
+    
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        if not self._loaded:
+            self.refresh()
+        return self.index.search(query_embeddings, n_results, where)
+    
+    def info(self) -> Dict[str, Any]:
+        return {"name": self.name, **self.index.info()}
+
+class QuantizedIndex(NumpyIndex):
+    """int8 scalar-quantized codes, optionally PCA-reduced, scanned in memory.
+    
+    The codes are scanned in memory; the top candidates are rescored against a
+    float16 memmap, half the size of the float32 export, which is only scratch
+    space for fitting the quantizer and removed after the build. Records keep ids
+    and metadata (for filters); the text of the final hits is read from the collection.
+    """
+    
+    def __init__(self, directory: str, pca_dim: int = QUANTIZED_PCA_DIM, rescore_factor: int = QUANTIZED_RESCORE_FACTOR):
+        super().__init__(directory)
+        self.codes_path = os.path.join(directory, "codes.i8")
+        self.quantizer_path = os.path.join(directory, "quantizer.npz")
+        self.rescore_path = os.path.join(directory, "embeddings.f16")
+        self.pca_dim = pca_dim
+        self.rescore_factor = rescore_factor
+        self.collection = None
+        self.codes: Optional[np.ndarray] = None
+        self.rescore_matrix: Optional[np.ndarray] = None
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.recall: Dict[str, Any] = {}
+    
+    def load(self) -> bool:
+        paths = (self.records_path, self.quantizer_path, self.codes_path, self.rescore_path)
+        if not all(os.path.exists(path) for path in paths):
+            return False
+        try:
+            records = self._read_records()
+            count, dimension = records["count"], records["dimension"]
+            if os.path.getsize(self.rescore_path) != count * dimension * 2:
+                logger.warning(f"Quantized index at {self.directory} is inconsistent, ignoring it")
+                return False
+            self._precompute_masks()
+            self.matrix = None
+            with np.load(self.quantizer_path) as quantizer:
+                if str(quantizer["version"]) != str(self.version) or int(quantizer["pca_dim"]) != self.pca_dim:
+                    return False
+                self.mean = quantizer["mean"]
+                self.components = quantizer["components"]
+                self.offsets = quantizer["offsets"]
+                self.scales = quantizer["scales"]
+                self.recall = json.loads(str(quantizer["recall"]))
+            self.codes = np.fromfile(self.codes_path, dtype=np.int8).reshape(len(self.ids), len(self.scales))
+            self.rescore_matrix = (
+                np.memmap(self.rescore_path, dtype=np.float16, mode='r', shape=(count, dimension))
+                if count else np.zeros((0, dimension), dtype=np.float16)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error loading quantized index: {str(e)}")
+            return False
+    
+    def build(self, collection, version: Optional[str] = None):
+        """Export the collection, fit the projection and quantizer, write the codes and float16 rows, then drop the float32 export"""
+        self.collection = collection
+        # The float32 export is only mapped for fitting, recall measurement and then removed
+        self._export(collection, version, with_documents=False)
+        super().load()
+        self._quantize(version)
+        self._write_rescore_matrix()
+        self.recall = self.recall_report()
+        logger.info(f"Quantized index recall: {self.recall}")
+        np.savez(f"{self.quantizer_path}.tmp.npz", version=str(version), pca_dim=self.pca_dim, mean=self.mean,
+                 components=self.components, offsets=self.offsets, scales=self.scales, recall=json.dumps(self.recall))
+        
+        # Rescoring reads the float16 rows, so no float32 copy is kept next to Chroma's
+        self.matrix = None
+        os.remove(self.matrix_path)
+        os.replace(f"{self.quantizer_path}.tmp.npz", self.quantizer_path)
+        self.load()
+    
+    def _project(self, vectors: np.ndarray) -> np.ndarray:
+        if self.components.size:
+            return (vectors - self.mean) @ self.components
+        return vectors
+    
+    def _quantize(self, version: Optional[str]):
+        count, dimension = self.matrix.shape
+        if 0 < self.pca_dim < dimension and count > self.pca_dim:
+            rng = np.random.RandomState(0)
+            sample = np.asarray(self.matrix[np.sort(rng.choice(count, min(count, PCA_FIT_SAMPLE), replace=False))])
+            self.mean = sample.mean(axis=0)
+            _, _, components = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(components[:self.pca_dim].T, dtype=np.float32)
+        else:
+            self.mean = np.zeros(0, dtype=np.float32)
+            self.components = np.zeros((0, 0), dtype=np.float32)
+        
+        blocks = [self._project(np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS])) for start in range(0, count, SCORE_BLOCK_ROWS)]
+        width = blocks[0].shape[1] if blocks else dimension
+        low = np.min([block.min(axis=0) for block in blocks], axis=0) if blocks else np.zeros(width, dtype=np.float32)
+        high = np.max([block.max(axis=0) for block in blocks], axis=0) if blocks else np.zeros(width, dtype=np.float32)
+        self.offsets = low.astype(np.float32)
+        self.scales = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+        
+        tmp_codes_path = f"{self.codes_path}.tmp"
+        with open(tmp_codes_path, 'wb') as codes_file:
+            for block in blocks:
+                codes = np.clip(np.rint((block - self.offsets) / self.scales), 0, 255) - 128
+                codes_file.write(codes.astype(np.int8).tobytes())
+        os.replace(tmp_codes_path, self.codes_path)
+        self.codes = np.fromfile(self.codes_path, dtype=np.int8).reshape(count, width)
+    
+    def _write_rescore_matrix(self):
+        tmp_rescore_path = f"{self.rescore_path}.tmp"
+        with open(tmp_rescore_path, 'wb') as rescore_file:
+            for start in range(0, len(self.matrix), SCORE_BLOCK_ROWS):
+                rescore_file.write(np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS]).astype(np.float16).tobytes())
+        self.rescore_matrix = None
+        os.replace(tmp_rescore_path, self.rescore_path)
+        count, dimension = self.matrix.shape
+        self.rescore_matrix = (
+            np.memmap(self.rescore_path, dtype=np.float16, mode='r', shape=(count, dimension))
+            if count else np.zeros((0, dimension), dtype=np.float16)
+        )
+    
+    def approximate_scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """Cosine estimates for every row, decoded block by block from the int8 codes"""
+        projected = self._project(np.asarray(query_embeddings, dtype=np.float32))
+        weights = projected * self.scales
+        # Decoded value = offset + (code + 128) * scale; the code-independent part is one term per query
+        constant = projected @ (self.offsets + 128 * self.scales)
+        if self.components.size:
+            constant += np.asarray(query_embeddings, dtype=np.float32) @ self.mean
+        scores = np.empty((len(projected), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = weights @ block.T
+        return scores + constant[:, None]
+    
+    def _documents(self, ids: List[str]) -> Dict[str, str]:
+        """Text of the given chunks, read from the collection (documents only, never its vectors)"""
+        if not ids:
+            return {}
+        page = self.collection.get(ids=ids, include=["documents"])
+        return dict(zip(page['ids'], page['documents']))
+    
+    def search(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        """Approximate top candidates from the codes, rescored against the float16 rows"""
+        if not len(self.ids):
+            return [[] for _ in range(len(query_embeddings))]
+        
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        scores = self.approximate_scores(query_embeddings)
+        if where:
+            scores[:, ~self.filter_mask(where)] = -np.inf
+        
+        k = min(max(n_results * self.rescore_factor, n_results), scores.shape[1])
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        
+        ranked = []
+        for query, query_scores, rows in zip(query_embeddings, scores, candidates):
+            rows = np.sort(rows[np.isfinite(query_scores[rows])])
+            if self.rescore_factor > 0 and len(rows):
+                exact = np.asarray(self.rescore_matrix[rows], dtype=np.float32) @ query
+            else:
+                exact = query_scores[rows]
+            order = np.argsort(-exact, kind='stable')[:n_results]
+            ranked.append([(rows[i], exact[i]) for i in order])
+        
+        # One read for every query's final hits; rows missing from the collection are dropped
+        documents = self._documents(sorted({self.ids[row] for hits in ranked for row, _ in hits}))
+        return [
+            [
+                (self.ids[row], documents[self.ids[row]], self.metadatas[row], float(2.0 - 2.0 * score))
+                for row, score in hits if self.ids[row] in documents
+            ]
+            for hits in ranked
+        ]
+    
+    def recall_report(self, sample_queries: int = RECALL_SAMPLE_QUERIES, k: int = 10) -> Dict[str, Any]:
+        """Recall@k of this index against exact search, on queries made from pairs of stored vectors"""
+        count = len(self.ids)
+        report = {
+            "k": k,
+            "queries": 0,
+            "dimensions": int(self.codes.shape[1]) if self.codes is not None else self.pca_dim,
+            "codes_bytes": os.path.getsize(self.codes_path) if os.path.exists(self.codes_path) else 0,
+            # The float32 matrix the numpy backend scans in memory instead of the codes
+            "float32_bytes": count * self.dimension * 4
+        }
+        if report["codes_bytes"]:
+            report["memory_compression"] = round(report["float32_bytes"] / report["codes_bytes"], 2)
+        if not count or self.codes is None:
+            return report
+        
+        rng = np.random.RandomState(1)
+        pairs = rng.randint(0, count, size=(min(sample_queries, count), 2))
+        queries = np.asarray(self.matrix[pairs[:, 0]]) + np.asarray(self.matrix[pairs[:, 1]])
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        
+        k = min(k, count)
+        # Exact top-k straight from the float32 export, which only exists during the build
+        exact = np.argpartition(-(queries @ self.matrix.T), k - 1, axis=1)[:, :k]
+        approximate = self.search(queries, k)
+        found = [len({hit[0] for hit in a} & {self.ids[row] for row in e}) / k for a, e in zip(approximate, exact)]
+        report.update({"k": k, "queries": len(queries), "recall_at_k": round(float(np.mean(found)), 4)})
+        return report
+    
+    def info(self) -> Dict[str, Any]:
+        """Recall and in-memory compression from the last build, plus every file the index keeps on disk"""
+        paths = (self.codes_path, self.rescore_path, self.quantizer_path, self.records_path)
+        return {
+            "vectors": len(self.ids),
+            **self.recall,
+            "index_bytes": sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        }
+
+class QuantizedSearchBackend(NumpySearchBackend):
+    """int8 (optionally PCA-reduced) codes in memory, rescoring from a float16 memmap"""
+    
+    name = "quantized"
+    
+    def __init__(self, store):
+        super().__init__(store)
+        self.index = QuantizedIndex(os.path.join(store.persistence_dir, "quantized_index"))
+    
+    def refresh(self):
+        # The store may have reopened its collection (forced ingest, snapshot restore)
+        self.index.collection = self.store.collection
+        super().refresh()
+    
+    def query(self, query_embeddings: np.ndarray, n_results: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        self.index.collection = self.store.collection
+        return super().query(query_embeddings, n_results, where)
+    
+    def info(self) -> Dict[str, Any]:
+        """Index stats plus the whole store's footprint: this index sits on top of Chroma's own float32 vectors"""
+        info = super().info()
+        info["store_bytes"] = path_size(self.store.persistence_dir) if os.path.exists(self.store.persistence_dir) else 0
+        return info
+
+SEARCH_BACKENDS = {
+    ChromaSearchBackend.name: ChromaSearchBackend,
+    NumpySearchBackend.name: NumpySearchBackend,
+    QuantizedSearchBackend.name: QuantizedSearchBackend
+}
+
+def create_search_backend(store, name: str = SEARCH_BACKEND):
+    """Instantiate the configured search backend for a VectorStore"""
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend '{name}', expected one of {sorted(SEARCH_BACKENDS)}")
+    return SEARCH_BACKENDS[name](store)
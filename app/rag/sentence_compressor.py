@@ -0,0 +1,87 @@
+import os
+import re
+import logging
+from typing import List, Optional
+import numpy as np
+from app.rag.bm25 import tokenize
+from app.rag.embeddings import embedding_engine
+from app.rag.query_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+# Fraction of each chunk's characters to keep; 1.0 keeps chunks whole
+COMPRESSION_RATIO = float(os.getenv("COMPRESSION_RATIO", "0.4"))
+# Sentences kept on each side of a selected sentence, so advice keeps its lead-in
+COMPRESSION_NEIGHBOURS = int(os.getenv("COMPRESSION_NEIGHBOURS", "1"))
+# Sentence vectors kept in memory, so chunks retrieved again are not re-encoded
+SENTENCE_CACHE_SIZE = int(os.getenv("SENTENCE_CACHE_SIZE", "8192"))
+# Weight of embedding similarity against query term overlap in a sentence's score
+SIMILARITY_WEIGHT = 0.7
+# Chunks this short are kept as they are
+MIN_SENTENCES = 4
+GAP_MARKER = "..."
+
+# Sentence ends, line breaks and "- " bullets: documents list much of their advice as bullets
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"(])|\s*\n\s*|\s+(?=-\s)')
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences, bullets and headings of a chunk, whitespace-normalized"""
+    return [" ".join(sentence.split()) for sentence in _SENTENCE_SPLIT.split(text) if sentence and sentence.strip()]
+
+class SentenceCompressor:
+    """Query-focused extractive compression of retrieved chunks.
+    
+    Sentences are scored by embedding similarity and term overlap with the query;
+    the best ones and their neighbours are kept in document order until the target
+    ratio of the chunk is reached.
+    """
+    
+    def __init__(self, ratio: float = COMPRESSION_RATIO, neighbours: int = COMPRESSION_NEIGHBOURS,
+                 cache_size: int = SENTENCE_CACHE_SIZE):
+        self.ratio = ratio
+        self.neighbours = neighbours
+        self.sentence_cache = LRUCache(cache_size)
+    
+    def score(self, query: str, sentences: List[str]) -> np.ndarray:
+        """Relevance of each sentence to the query"""
+        query_terms = set(tokenize(query))
+        overlap = np.array([
+            len(query_terms.intersection(tokenize(sentence))) / len(query_terms) if query_terms else 0.0
+            for sentence in sentences
+        ], dtype=np.float32)
+        if not embedding_engine.is_loaded:
+            # Model still loading (BM25 fast path): term overlap alone
+            return overlap
+        similarity = embedding_engine.embed_memoized(sentences, self.sentence_cache) @ embedding_engine.embed_query(query)
+        return SIMILARITY_WEIGHT * similarity + (1 - SIMILARITY_WEIGHT) * overlap
+    
+    def compress(self, query: str, text: str, ratio: Optional[float] = None) -> str:
+        """The sentences of text most relevant to the query, with omissions marked by '...'"""
+        ratio = self.ratio if ratio is None else ratio
+        sentences = split_sentences(text)
+        if ratio >= 1.0 or len(sentences) < MIN_SENTENCES:
+            return text
+        
+        target = ratio * sum(len(sentence) for sentence in sentences)
+        kept, kept_chars = set(), 0
+        for best in np.argsort(-self.score(query, sentences), kind="stable"):
+            if kept and kept_chars >= target:
+                break
+            for i in range(max(0, best - self.neighbours), min(len(sentences), best + self.neighbours + 1)):
+                if i not in kept:
+                    kept.add(i)
+                    kept_chars += len(sentences[i])
+        
+        parts, previous = [], -1
+        for i in sorted(kept):
+            if i != previous + 1:
+                parts.append(GAP_MARKER)
+            parts.append(sentences[i])
+            previous = i
+        if previous < len(sentences) - 1:
+            parts.append(GAP_MARKER)
+        return " ".join(parts)
+
+# Initialize the shared sentence compressor
+sentence_compressor = SentenceCompressor()
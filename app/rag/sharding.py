@@ -0,0 +1,236 @@
+import os
+import json
+import zlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_BY = os.getenv("SHARD_BY", "hash")
+SHARD_KEYS = ("hash", "crop", "region")
+ROUTING_FILENAME = "shard_routing.json"
+
+def _is_routing_field(field: str) -> bool:
+    """Low-cardinality tag fields whose values are tracked per shard"""
+    return field in ("crop", "region") or field.startswith(("crop_", "region_"))
+
+def _routing_key(field: str, value: Any) -> str:
+    return f"{field}={json.dumps(value)}"
+
+class ShardRouter:
+    """Places chunks on shards and tracks which tag values each shard holds.
+    
+    A filter is only sent to shards that can match it: equality/$in clauses on
+    tag fields (crop, region, crop_*, region_*) prune shards, anything else keeps
+    them all. Values are never forgotten on delete, so routing stays conservative.
+    """
+    
+    def __init__(self, directory: str, shard_count: int = SHARD_COUNT, shard_by: str = SHARD_BY):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key '{shard_by}', expected one of {SHARD_KEYS}")
+        self.path = os.path.join(directory, ROUTING_FILENAME)
+        self.shard_count = max(1, shard_count)
+        self.shard_by = shard_by
+        self.values: List[Set[str]] = [set() for _ in range(self.shard_count)]
+        self._lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("shard_count") == self.shard_count and data.get("shard_by") == self.shard_by:
+                self.values = [set(values) for values in data["values"]]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable shard routing table {self.path}: {str(e)}")
+    
+    def save(self):
+        with self._lock:
+            data = {
+                "shard_count": self.shard_count,
+                "shard_by": self.shard_by,
+                "values": [sorted(values) for values in self.values]
+            }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
+    
+    def clear(self):
+        with self._lock:
+            self.values = [set() for _ in range(self.shard_count)]
+    
+    def shard_for(self, metadata: Dict[str, Any]) -> int:
+        """Shard of a chunk: by source document hash, or by its primary crop or region"""
+        key = metadata.get('source', '') if self.shard_by == "hash" else metadata.get(self.shard_by, '')
+        return zlib.crc32(str(key).encode('utf-8')) % self.shard_count
+    
+    def record(self, shard: int, metadata: Dict[str, Any]):
+        with self._lock:
+            self.values[shard].update(
+                _routing_key(field, value) for field, value in metadata.items() if _is_routing_field(field)
+            )
+    
+    def _shards_with(self, field: str, values: List[Any]) -> Set[int]:
+        keys = {_routing_key(field, value) for value in values}
+        return {shard for shard, held in enumerate(self.values) if keys & held}
+    
+    def route(self, where: Optional[Dict[str, Any]]) -> List[int]:
+        """Shards that may hold chunks matching a Chroma where filter"""
+        everything = set(range(self.shard_count))
+        if not where:
+            return sorted(everything)
+        with self._lock:
+            return sorted(self._route(where, everything))
+    
+    def _route(self, where: Dict[str, Any], everything: Set[int]) -> Set[int]:
+        shards = set(everything)
+        for field, condition in where.items():
+            if field == "$and":
+                for clause in condition:
+                    shards &= self._route(clause, everything)
+            elif field == "$or":
+                shards &= set().union(*(self._route(clause, everything) for clause in condition))
+            elif _is_routing_field(field):
+                if not isinstance(condition, dict):
+                    shards &= self._shards_with(field, [condition])
+                elif set(condition) == {"$eq"}:
+                    shards &= self._shards_with(field, [condition["$eq"]])
+                elif set(condition) == {"$in"}:
+                    shards &= self._shards_with(field, condition["$in"])
+        return shards
+
+class ShardedCollection:
+    """The subset of the Chroma collection API VectorStore uses, spread over N collections.
+    
+    Writes go to each chunk's shard and queries fan out concurrently to the routed
+    shards, merging their top-k by distance.
+    """
+    
+    def __init__(self, shards: List[Any], router: ShardRouter):
+        self.shards = shards
+        self.router = router
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard")
+    
+    def _map(self, func, shards: List[int]) -> List[Any]:
+        if len(shards) == 1:
+            return [func(shards[0])]
+        return list(self._pool.map(func, shards))
+    
+    def count(self) -> int:
+        return sum(self._map(lambda shard: self.shards[shard].count(), list(range(len(self.shards)))))
+    
+    def upsert(self, ids: List[str], embeddings=None, documents=None, metadatas=None):
+        groups: Dict[int, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            shard = self.router.shard_for(metadata)
+            self.router.record(shard, metadata)
+            groups.setdefault(shard, []).append(i)
+        # Recorded before writing so routing never misses a stored chunk
+        self.router.save()
+        
+        def write(shard: int):
+            rows = groups[shard]
+            if self.router.shard_by != "hash":
+                # A re-tagged chunk changes shard; drop its copy from the one it was on before
+                moved = [ids[i] for i in rows]
+                for other, collection in enumerate(self.shards):
+                    if other != shard:
+                        collection.delete(ids=moved)
+            self.shards[shard].upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows] if embeddings is not None else None,
+                documents=[documents[i] for i in rows] if documents is not None else None,
+                metadatas=[metadatas[i] for i in rows]
+            )
+        self._map(write, sorted(groups))
+    
+    def delete(self, ids: List[str]):
+        self._map(lambda shard: self.shards[shard].delete(ids=ids), list(range(len(self.shards))))
+    
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Update metadata in place; a chunk never moves between shards"""
+        positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        
+        def update_shard(shard: int):
+            found = self.shards[shard].get(ids=ids, include=[])['ids']
+            if found:
+                for chunk_id in found:
+                    self.router.record(shard, metadatas[positions[chunk_id]])
+                self.shards[shard].update(ids=found, metadatas=[metadatas[positions[chunk_id]] for chunk_id in found])
+        self._map(update_shard, list(range(len(self.shards))))
+        self.router.save()
+    
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Optional[List[str]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        include = include if include is not None else ["documents", "metadatas"]
+        merged: Dict[str, List[Any]] = {"ids": [], **{field: [] for field in include}}
+        
+        def extend(page):
+            merged["ids"].extend(page["ids"])
+            for field in include:
+                merged[field].extend(list(page[field]) if page.get(field) is not None else [None] * len(page["ids"]))
+        
+        if ids is not None or limit is None:
+            for page in self._map(lambda shard: self.shards[shard].get(ids=ids, where=where, include=include), self.router.route(where)):
+                extend(page)
+            if ids is not None:
+                order = {chunk_id: i for i, chunk_id in enumerate(ids)}
+                rows = sorted(range(len(merged["ids"])), key=lambda row: order.get(merged["ids"][row], len(order)))
+                merged = {field: [values[row] for row in rows] for field, values in merged.items()}
+            return merged
+        
+        # Paged export: walk the shards in order, translating the global offset
+        skip, remaining = offset or 0, limit
+        for shard in self.router.route(where):
+            if remaining <= 0:
+                break
+            if skip:
+                # With a filter, only the matching rows count towards the offset
+                collection = self.shards[shard]
+                size = collection.count() if not where else len(collection.get(where=where, include=[])["ids"])
+                if skip >= size:
+                    skip -= size
+                    continue
+            page = self.shards[shard].get(where=where, include=include, limit=remaining, offset=skip)
+            extend(page)
+            remaining -= len(page["ids"])
+            skip = 0
+        return merged
+    
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Concurrent top-k on every routed shard, merged per query by distance"""
+        shards = self.router.route(where)
+        merged: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not shards:
+            for field in merged:
+                merged[field] = [[] for _ in query_embeddings]
+            return merged
+        
+        def search(shard: int):
+            collection = self.shards[shard]
+            size = collection.count()
+            if not size:
+                return None
+            return collection.query(query_embeddings=query_embeddings, n_results=min(n_results, size), where=where)
+        
+        results = [result for result in self._map(search, shards) if result is not None]
+        for i in range(len(query_embeddings)):
+            hits = [
+                (result["distances"][i][j], result["ids"][i][j], result["documents"][i][j], result["metadatas"][i][j])
+                for result in results for j in range(len(result["ids"][i]))
+            ]
+            hits.sort(key=lambda hit: (hit[0], hit[1]))
+            hits = hits[:n_results]
+            merged["distances"].append([hit[0] for hit in hits])
+            merged["ids"].append([hit[1] for hit in hits])
+            merged["documents"].append([hit[2] for hit in hits])
+            merged["metadatas"].append([hit[3] for hit in hits])
+        return merged
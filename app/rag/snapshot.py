@@ -0,0 +1,101 @@
+import io
+import os
+import json
+import shutil
+import tarfile
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from app.rag.manifest import IngestManifest
+from app.rag.maintenance import CHROMA_DB_FILENAME, find_orphaned_segments
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_INFO_FILENAME = "snapshot.json"
+
+def _is_temporary(name: str) -> bool:
+    return name.endswith(".tmp") or ".tmp." in name
+
+def export_snapshot(persistence_dir: str, archive_path: str) -> Dict[str, Any]:
+    """Pack the collection, manifest and auxiliary indexes into one versioned .tar.gz archive.
+    
+    The version is the manifest fingerprint, so two snapshots of the same content
+    and settings carry the same version. Orphaned segments and temp files are left out.
+    """
+    manifest = IngestManifest.load(persistence_dir)
+    if not manifest.files:
+        raise ValueError(f"No ingested knowledge base in {persistence_dir}")
+    orphans = set()
+    if os.path.exists(os.path.join(persistence_dir, CHROMA_DB_FILENAME)):
+        orphans = set(find_orphaned_segments(persistence_dir))
+    
+    info = {
+        "format": SNAPSHOT_FORMAT,
+        "version": manifest.fingerprint(),
+        "created_at": datetime.now().isoformat(),
+        "settings": manifest.settings,
+        "files": len(manifest.files),
+        "chunk_count": manifest.indexed_count()
+    }
+    payload = json.dumps(info, indent=2).encode('utf-8')
+    
+    os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+    tmp_path = f"{archive_path}.tmp"
+    with tarfile.open(tmp_path, "w:gz") as archive:
+        entry = tarfile.TarInfo(SNAPSHOT_INFO_FILENAME)
+        entry.size = len(payload)
+        archive.addfile(entry, io.BytesIO(payload))
+        for name in sorted(os.listdir(persistence_dir)):
+            if name in orphans or name == SNAPSHOT_INFO_FILENAME or _is_temporary(name):
+                continue
+            archive.add(os.path.join(persistence_dir, name), arcname=name)
+    os.replace(tmp_path, archive_path)
+    logger.info(f"Exported knowledge base snapshot {info['version'][:12]} to {archive_path}")
+    return info
+
+def read_snapshot_info(archive_path: str) -> Dict[str, Any]:
+    with tarfile.open(archive_path, "r:*") as archive:
+        info = json.load(archive.extractfile(SNAPSHOT_INFO_FILENAME))
+    if info.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {info.get('format')} in {archive_path}")
+    return info
+
+def _safe_members(archive: tarfile.TarFile):
+    """Regular files and directories that stay inside the extraction directory"""
+    for member in archive.getmembers():
+        path = os.path.normpath(member.name)
+        if os.path.isabs(path) or path.startswith(".."):
+            raise ValueError(f"Unsafe path {member.name} in snapshot")
+        if member.isfile() or member.isdir():
+            yield member
+
+def import_snapshot(archive_path: str, persistence_dir: str,
+                    expected_settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Replace persistence_dir with the snapshot's contents, unless it already holds that version.
+    
+    Extracts next to the target and swaps directories, so readers never see a half
+    extracted store. Must run before a Chroma client opens persistence_dir.
+    """
+    info = read_snapshot_info(archive_path)
+    if expected_settings is not None and info["settings"] != expected_settings:
+        raise ValueError(f"Snapshot {info['version'][:12]} was built with {info['settings']}, expected {expected_settings}")
+    
+    current = IngestManifest.load(persistence_dir)
+    if current.files and current.fingerprint() == info["version"]:
+        logger.info(f"Knowledge base snapshot {info['version'][:12]} already in place")
+        return {**info, "imported": False}
+    
+    target = os.path.abspath(persistence_dir)
+    staging, previous = f"{target}.importing", f"{target}.previous"
+    for path in (staging, previous):
+        shutil.rmtree(path, ignore_errors=True)
+    with tarfile.open(archive_path, "r:*") as archive:
+        archive.extractall(staging, members=list(_safe_members(archive)))
+    
+    if os.path.exists(target):
+        os.replace(target, previous)
+    os.replace(staging, target)
+    shutil.rmtree(previous, ignore_errors=True)
+    logger.info(f"Imported knowledge base snapshot {info['version'][:12]} ({info['chunk_count']} chunks) into {target}")
+    return {**info, "imported": True}
@@ -1,81 +1,631 @@
-import chromadb
-from chromadb.config import Settings
 import os
+import time
 import logging
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from app.rag.document_processor import document_processor
-from typing import List, Dict, Any
+from app.rag.embeddings import embedding_engine
+from app.rag.manifest import IngestManifest
+from app.rag.query_cache import LRUCache, normalize_query
+from app.rag.retrieval_executor import retrieval_executor
+from app.rag.search_backends import SEARCH_BACKEND, create_search_backend
+from app.rag.dedup import INGEST_DEDUP, NearDuplicateIndex, load_signatures, save_signatures
+from app.rag.bm25 import BM25Index, term_frequencies
+from app.rag.metadata_tagger import tag_metadata
+from app.rag.maintenance import CHROMA_DB_FILENAME, compact_store
+from app.rag.snapshot import export_snapshot, import_snapshot
+from app.rag.sharding import SHARD_BY, SHARD_COUNT, ShardRouter, ShardedCollection
+from typing import List, Dict, Any, Callable, Optional
 
 logger = logging.getLogger(__name__)
 
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", "1"))
+DEFAULT_MAX_BATCH_SIZE = 5000
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_MODES = ("vector", "bm25", "hybrid")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Answer with BM25 alone while the embedding model is still loading
+BM25_FAST_PATH = os.getenv("BM25_FAST_PATH", "true").lower() == "true"
+# Each ranker contributes n_results * HYBRID_CANDIDATES candidates to the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+RRF_K = 60
+COLLECTION_NAME = "agricultural_knowledge"
+# Serve a prebuilt snapshot as is: no ingest, clear or compaction at runtime
+RAG_READ_ONLY = os.getenv("RAG_READ_ONLY", "false").lower() == "true"
+
 class VectorStore:
     def __init__(self):
         self.persistence_dir = "./app/data/chroma_db"
-        os.makedirs(self.persistence_dir, exist_ok=True)  # Ensure directory exists
-        self.client = chromadb.PersistentClient(path=self.persistence_dir)
-        self.collection = self.client.get_or_create_collection(
-            name="agricultural_knowledge",
-            metadata={"description": "Agricultural knowledge base for crop advisory"}
-        )
+        self.manifest = IngestManifest.load(self.persistence_dir)
         self.is_initialized = False
+        self.last_ingest_stats: Dict[str, Any] = {}
+        # Bumped whenever the indexed content changes; part of every search cache key
+        self.generation = 0
+        self.search_cache = LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+        self.search_backend_name = SEARCH_BACKEND
+        self.search_mode = SEARCH_MODE
+        self.read_only = RAG_READ_ONLY
+        self.shard_count = max(1, SHARD_COUNT)
+        self.shard_by = SHARD_BY
+        self._client = None
+        self._collection = None
+        self._search_backend = None
+        self._bm25_index = None
+        self._lock = threading.Lock()
+        # Serializes ingest and clear: requests on the retrieval executor can race /rag/initialize
+        self._ingest_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """Chroma client, opened on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Imported here so importing this module stays cheap
+                    import chromadb
+                    os.makedirs(self.persistence_dir, exist_ok=True)  # Ensure directory exists
+                    self._client = chromadb.PersistentClient(path=self.persistence_dir)
+        return self._client
+    
+    @property
+    def collection(self):
+        """Knowledge collection, opened on first use"""
+        if self._collection is None:
+            client = self.client
+            with self._lock:
+                if self._collection is None:
+                    self._collection = self._get_or_create_collection(client)
+        return self._collection
+    
+    @property
+    def search_backend(self):
+        """Backend that answers queries, chosen by SEARCH_BACKEND"""
+        if self._search_backend is None:
+            with self._lock:
+                if self._search_backend is None:
+                    self._search_backend = create_search_backend(self, self.search_backend_name)
+        return self._search_backend
+    
+    @property
+    def bm25_index(self) -> BM25Index:
+        """Keyword index, read from disk on first use"""
+        if self._bm25_index is None:
+            with self._lock:
+                if self._bm25_index is None:
+                    self._bm25_index = BM25Index.load(self.persistence_dir)
+        return self._bm25_index
+    
+    @bm25_index.setter
+    def bm25_index(self, index: BM25Index):
+        self._bm25_index = index
+    
+    @property
+    def is_ready(self) -> bool:
+        """True once the collection is open and the embedding model is loaded"""
+        return self._collection is not None and embedding_engine.is_loaded
+    
+    def warm_up(self):
+        """Open the collection and load the BM25 index and embedding model ahead of the first query"""
+        count = self.collection.count()
+        if self.is_initialized and count != self.manifest.indexed_count():
+            # Restored from a manifest that does not describe this collection; the next request re-ingests
+            logger.warning(f"Collection holds {count} chunks but the manifest lists {self.manifest.indexed_count()}")
+            self.is_initialized = False
+        # Loaded first so the BM25 fast path can answer while the model loads
+        logger.info(f"BM25 index loaded with {len(self.bm25_index)} chunks")
+        embedding_engine.load()
+        logger.info("Vector store warmed up")
+    
+    def ingest_settings(self) -> Dict[str, Any]:
+        """Embedding model and chunking parameters the stored chunks must have been built with"""
+        settings = {"embedding_model": embedding_engine.model_name, **document_processor.chunk_settings()}
+        if self.shard_count > 1:
+            # Changing the layout re-ingests into the new shards
+            settings.update(shards=self.shard_count, shard_by=self.shard_by)
+        return settings
     
-    def initialize_knowledge_base(self, documents_dir: str = "./app/data/documents"):
-        """Initialize the knowledge base with documents"""
+    def restore(self) -> bool:
+        """Mark the store initialized from its persisted manifest, without touching the documents.
+        
+        Only reads the manifest, so it takes milliseconds; warm_up later checks the
+        manifest's chunk count against the collection.
+        """
         if self.is_initialized:
+            return True
+        if not self.manifest.files or not self.manifest.matches(self.ingest_settings()):
+            return False
+        if not os.path.exists(os.path.join(self.persistence_dir, CHROMA_DB_FILENAME)):
+            return False
+        self.is_initialized = True
+        logger.info(f"Knowledge base restored from manifest: {len(self.manifest.files)} files, "
+                    f"{self.manifest.indexed_count()} chunks")
+        return True
+    
+    def _get_or_create_collection(self, client):
+        """Open the knowledge collection, or its shards when SHARD_COUNT > 1.
+        
+        Embeddings are supplied by the shared EmbeddingEngine.
+        """
+        if self.shard_count == 1:
+            return self._open_collection(client, COLLECTION_NAME)
+        shards = [self._open_collection(client, f"{COLLECTION_NAME}_shard{i}") for i in range(self.shard_count)]
+        return ShardedCollection(shards, ShardRouter(self.persistence_dir, self.shard_count, self.shard_by))
+    
+    def _open_collection(self, client, name: str):
+        return client.get_or_create_collection(
+            name=name,
+            metadata={"description": "Agricultural knowledge base for crop advisory"},
+            embedding_function=None
+        )
+    
+    def initialize_knowledge_base(self, documents_dir: str = "./app/data/documents", force: bool = False,
+                                  workers: Optional[int] = None, batch_size: int = INGEST_BATCH_SIZE,
+                                  dedup: bool = INGEST_DEDUP, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """Initialize the knowledge base, re-embedding only chunks whose content changed.
+        
+        With dedup, near-duplicate chunks (MinHash/LSH) are indexed once and every file
+        they occur in is listed in the kept chunk's 'sources' metadata.
+        
+        The manifest doubles as a checkpoint: it is saved after every committed batch
+        and only lists files whose chunks are all stored, so an interrupted run resumes
+        where it stopped. progress, if given, receives the running stats after each batch.
+        Concurrent calls run one at a time; a caller that waited returns once another initialized it.
+        """
+        if self.is_initialized and not force:
             logger.info("Knowledge base already initialized")
             return True
+        with self._ingest_lock:
+            if self.is_initialized and not force:
+                logger.info("Knowledge base initialized while waiting")
+                return True
+            return self._ingest(documents_dir, force, workers, batch_size, dedup, progress)
+    
+    def _ingest(self, documents_dir: str, force: bool, workers: Optional[int], batch_size: int, dedup: bool,
+                progress: Optional[Callable[[Dict[str, Any]], None]]) -> bool:
+        if self.read_only:
+            logger.warning("Vector store is read-only, serving the existing knowledge base without ingesting")
+            return self.restore()
+        
+        if not os.path.exists(documents_dir):
+            logger.warning(f"Documents directory {documents_dir} does not exist")
+            return False
             
         try:
-            # Process documents
-            documents = document_processor.process_documents(documents_dir)
+            settings = self.ingest_settings()
+            if self.manifest.settings and not self.manifest.matches(settings):
+                # Chunks or vectors built with another model or chunking are unusable
+                logger.info("Embedding model or chunking settings changed, rebuilding the knowledge base")
+                force = True
+            if force:
+                # A cleared manifest cannot tell which stored chunks are stale, so start from an empty collection
+                self._reset_collection()
+            if force or self.collection.count() == 0:
+                # The manifest describes a collection that is gone or must be rebuilt
+                self.manifest.clear()
+                self.bm25_index.clear()
+            self.manifest.settings = settings
+            
+            filenames = document_processor.list_documents(documents_dir)
+            removed_files = [name for name in self.manifest.files if name not in filenames]
+            deleted = 0
+            
+            current_hashes = {}
+            for filename in filenames:
+                try:
+                    current_hashes[filename] = document_processor.file_hash(os.path.join(documents_dir, filename))
+                except OSError as e:
+                    logger.error(f"Error reading {filename}, keeping previous version: {str(e)}")
+            changed = {name for name, file_hash in current_hashes.items() if file_hash != self.manifest.file_hash(name)}
+            
+            duplicate_index, signatures, touched = None, {}, set()
+            if dedup:
+                signatures = load_signatures(self.persistence_dir)
+                changed |= self._files_to_recheck(current_hashes, changed, removed_files, signatures)
+                duplicate_index = NearDuplicateIndex()
+                for filename in sorted(set(current_hashes) - changed):
+                    chunk_hashes = self.manifest.chunk_hashes(filename)
+                    for chunk_id in self.manifest.indexed_ids(filename):
+                        duplicate_index.add(chunk_id, signatures[chunk_hashes[chunk_id]])
+            else:
+                # Chunks skipped by an earlier dedup run must be indexed again
+                changed |= {name for name in current_hashes if self.manifest.duplicates(name)}
+            unchanged_files = len(current_hashes) - len(changed)
+            
+            # Stream one document at a time and write in bounded batches; with WRITE_CONCURRENCY > 1
+            # a commit holds that many batches, embedded and written concurrently
+            pending, pending_files = [], []
+            commit_size = batch_size * max(1, WRITE_CONCURRENCY)
+            changed_paths = [os.path.join(documents_dir, name) for name in filenames if name in changed]
+            stats = {
+                "files_total": len(changed_paths),
+                "files_unchanged": unchanged_files,
+                "files_processed": 0,
+                "files_committed": 0,
+                "chunks_processed": 0,
+                "chunks_upserted": 0,
+                "embeddings_computed": 0,
+                "batches": 0,
+                "embed_seconds": 0.0,
+                "upsert_seconds": 0.0,
+                "started_at": time.time()
+            }
+            self.last_ingest_stats = stats
+            
+            for file_path, documents in document_processor.iter_processed_files(changed_paths, workers):
+                filename = os.path.basename(file_path)
+                stats["files_processed"] += 1
+                stats["chunks_processed"] += len(documents)
+                if not documents:
+                    # Leave the previous chunks in place and retry on the next run
+                    logger.warning(f"No chunks extracted from {filename}, keeping previous version")
+                    continue
+                
+                previous = self.manifest.chunk_hashes(filename)
+                previous_duplicates = self.manifest.duplicates(filename)
+                touched.update(previous_duplicates.values())
+                
+                duplicates = {}
+                for doc in documents:
+                    if duplicate_index is not None:
+                        signature = duplicate_index.signature(doc['content'])
+                        kept_id = duplicate_index.find(signature)
+                        if kept_id is not None:
+                            duplicates[doc['id']] = kept_id
+                            touched.add(kept_id)
+                            continue
+                        duplicate_index.add(doc['id'], signature)
+                        signatures[doc['hash']] = signature
+                    
+                    if previous.get(doc['id']) != doc['hash'] or doc['id'] in previous_duplicates:
+                        pending.append(doc)
+                        if len(pending) >= commit_size:
+                            self._commit_batch(pending, pending_files, stats, progress, batch_size)
+                            pending, pending_files = [], []
+                
+                indexed_ids = {doc['id'] for doc in documents if doc['id'] not in duplicates}
+                stale_ids = [chunk_id for chunk_id in self.manifest.indexed_ids(filename) if chunk_id not in indexed_ids]
+                if stale_ids:
+                    self.delete_ids(stale_ids)
+                
+                deleted += len(stale_ids)
+                # Recorded in the manifest once the file's last pending chunk is committed
+                pending_files.append(
+                    (filename, current_hashes[filename], {doc['id']: doc['hash'] for doc in documents}, duplicates)
+                )
+            
+            if pending or pending_files:
+                self._commit_batch(pending, pending_files, stats, progress, batch_size)
+            upserted = stats["chunks_upserted"]
             
-            if not documents:
+            # Drop chunks whose source document was removed
+            for filename in removed_files:
+                touched.update(self.manifest.duplicates(filename).values())
+                stale_ids = self.manifest.indexed_ids(filename)
+                if stale_ids:
+                    self.delete_ids(stale_ids)
+                deleted += len(stale_ids)
+                self.manifest.remove_file(filename)
+            
+            if dedup:
+                self._update_duplicate_sources(touched)
+                live_hashes = {
+                    self.manifest.chunk_hashes(filename)[chunk_id]
+                    for filename in self.manifest.files for chunk_id in self.manifest.indexed_ids(filename)
+                }
+                save_signatures(self.persistence_dir, {h: sig for h, sig in signatures.items() if h in live_hashes})
+            
+            if len(self.bm25_index) != self.collection.count():
+                # Stores built before the BM25 index existed, or an index lost on disk
+                self.bm25_index.rebuild(self.collection)
+            self.bm25_index.save()
+            self.manifest.save()
+            
+            if self.collection.count() == 0:
                 logger.warning("No documents found to initialize knowledge base")
                 return False
             
-            # Add to vector store
-            self.collection.add(
-                documents=[doc['content'] for doc in documents],
-                metadatas=[doc['metadata'] for doc in documents],
-                ids=[doc['id'] for doc in documents]
-            )
-            
+            self.search_backend.refresh()
+            self.bump_generation()
             self.is_initialized = True
-            logger.info(f"Knowledge base initialized with {len(documents)} document chunks")
+            duplicate_count = sum(len(self.manifest.duplicates(name)) for name in self.manifest.files)
+            logger.info(
+                f"Knowledge base initialized: {upserted} chunks upserted, {deleted} deleted, "
+                f"{unchanged_files} unchanged files skipped, {duplicate_count} near-duplicates folded"
+            )
             return True
             
         except Exception as e:
             logger.error(f"Error initializing knowledge base: {str(e)}")
             return False
     
-    def search(self, query: str, n_results: int = 3, filter_metadata: Dict = None):
+    def _files_to_recheck(self, current_hashes: Dict[str, str], changed: set, removed_files: List[str],
+                          signatures: Dict[str, Any]) -> set:
+        """Unchanged files whose dedup state depends on chunks that are changing or lack signatures"""
+        recheck = set()
+        affected_ids = set()
+        for filename in changed | set(removed_files):
+            affected_ids.update(self.manifest.chunk_hashes(filename))
+        
+        for filename in current_hashes:
+            if filename in changed:
+                continue
+            chunk_hashes = self.manifest.chunk_hashes(filename)
+            if any(chunk_hashes[chunk_id] not in signatures for chunk_id in self.manifest.indexed_ids(filename)):
+                recheck.add(filename)
+                affected_ids.update(chunk_hashes)
+        
+        # A file whose duplicates point at an affected chunk may now hold the only copy
+        grew = True
+        while grew:
+            grew = False
+            for filename in current_hashes:
+                if filename in changed or filename in recheck:
+                    continue
+                if any(kept_id in affected_ids for kept_id in self.manifest.duplicates(filename).values()):
+                    recheck.add(filename)
+                    affected_ids.update(self.manifest.chunk_hashes(filename))
+                    grew = True
+        
+        return recheck
+    
+    def _update_duplicate_sources(self, kept_ids: set):
+        """Record every file a kept chunk occurs in as its 'sources' metadata, and merge their tags.
+        
+        Tags partly come from the filename, so the kept chunk gets the crop_*/region_*
+        flags of every occurrence; flags no occurrence has any more are set to False.
+        """
+        owners, sources = {}, {}
+        for filename in self.manifest.files:
+            for chunk_id in self.manifest.indexed_ids(filename):
+                owners[chunk_id] = filename
+            for kept_id in self.manifest.duplicates(filename).values():
+                sources.setdefault(kept_id, set()).add(filename)
+        
+        ids = [chunk_id for chunk_id in sorted(kept_ids) if chunk_id in owners]
+        if not ids:
+            return
+        
+        for batch in self._split(ids):
+            current = self.collection.get(ids=batch, include=['documents', 'metadatas'])
+            metadatas = []
+            for chunk_id, document, metadata in zip(current['ids'], current['documents'], current['metadatas']):
+                metadata = dict(metadata)
+                filenames = sorted({owners[chunk_id]} | sources.get(chunk_id, set()))
+                metadata['sources'] = '; '.join(filenames)
+                flags = {}
+                for filename in filenames:
+                    flags.update(
+                        (field, True) for field in tag_metadata(document, filename) if field.startswith(('crop_', 'region_'))
+                    )
+                for field in metadata:
+                    if field.startswith(('crop_', 'region_')) and field not in flags:
+                        flags[field] = False
+                metadata.update(flags)
+                metadatas.append(metadata)
+            self.collection.update(ids=current['ids'], metadatas=metadatas)
+    
+    def _commit_batch(self, pending: List[Dict[str, Any]], pending_files: List[tuple], stats: Dict[str, Any],
+                      progress: Optional[Callable[[Dict[str, Any]], None]] = None, batch_size: Optional[int] = None):
+        """Write pending chunks in batches of batch_size, then checkpoint the files whose chunks are now all stored"""
+        if pending:
+            self.bulk_upsert(pending, stats=stats, batch_size=batch_size)
+        for entry in pending_files:
+            self.manifest.update_file(*entry)
+        # The BM25 postings go first so the manifest never lists chunks they lack
+        self.bm25_index.save()
+        self.manifest.save()
+        
+        stats["files_committed"] += len(pending_files)
+        stats["batches"] += 1
+        if progress:
+            progress(stats)
+    
+    def max_batch_size(self) -> int:
+        """Largest number of records the backend accepts in a single write"""
+        client = self.client
+        if hasattr(client, "get_max_batch_size"):
+            return client.get_max_batch_size()
+        return getattr(client, "max_batch_size", DEFAULT_MAX_BATCH_SIZE)
+    
+    def _split(self, items: List[Any], batch_size: Optional[int] = None) -> List[List[Any]]:
+        limit = max(min(batch_size or self.max_batch_size(), self.max_batch_size()), 1)
+        return [items[i:i + limit] for i in range(0, len(items), limit)]
+    
+    def _write_batch(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Embed and upsert one batch that fits the backend limit, returning its timings"""
+        embed_started = time.time()
+        embeddings = document_processor.embed_documents(documents)
+        upsert_started = time.time()
+        self.collection.upsert(
+            documents=[doc['content'] for doc in documents],
+            embeddings=embeddings.tolist(),
+            metadatas=[doc['metadata'] for doc in documents],
+            ids=[doc['id'] for doc in documents]
+        )
+        return {
+            "size": len(documents),
+            "embed_seconds": upsert_started - embed_started,
+            "upsert_seconds": time.time() - upsert_started
+        }
+    
+    def bulk_upsert(self, documents: List[Dict[str, Any]], concurrency: Optional[int] = None,
+                    stats: Optional[Dict[str, Any]] = None, batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Embed and upsert chunk records in batches of batch_size, capped at the backend's max batch size.
+        
+        With concurrency > 1 the batches are committed from a thread pool, which
+        overlaps embedding of one batch with the write of another. Returns the
+        per-batch timings.
+        """
+        batches = self._split(documents, batch_size)
+        concurrency = concurrency or WRITE_CONCURRENCY
+        encoded_before = embedding_engine.encoded_texts
+        
+        if concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                timings = list(pool.map(self._write_batch, batches))
+        else:
+            timings = [self._write_batch(batch) for batch in batches]
+        
+        for doc in documents:
+            self.bm25_index.add(doc['id'], doc.get('terms') or term_frequencies(doc['content']))
+        
+        for batch_num, timing in enumerate(timings):
+            timing["batch"] = batch_num + 1
+            logger.debug(
+                f"Upsert batch {batch_num + 1}/{len(timings)}: {timing['size']} records, "
+                f"embed {timing['embed_seconds']:.3f}s, write {timing['upsert_seconds']:.3f}s"
+            )
+        
+        if stats is not None:
+            stats["chunks_upserted"] += len(documents)
+            stats["embeddings_computed"] += embedding_engine.encoded_texts - encoded_before
+            stats["embed_seconds"] += sum(timing["embed_seconds"] for timing in timings)
+            stats["upsert_seconds"] += sum(timing["upsert_seconds"] for timing in timings)
+            stats.setdefault("batch_timings", []).extend(timings)
+        return timings
+    
+    def delete_ids(self, ids: List[str]):
+        """Delete records by id, split to the backend's max batch size"""
+        for batch in self._split(ids):
+            self.collection.delete(ids=batch)
+        self.bm25_index.remove(ids)
+    
+    def _format_hits(self, hits) -> List[Dict[str, Any]]:
+        """Shape backend hits as ranked result dicts"""
+        return [
+            {
+                'content': doc,
+                'metadata': metadata,
+                'relevance_score': 1 - distance,  # Convert distance to similarity score
+                'rank': i + 1
+            }
+            for i, (_, doc, metadata, distance) in enumerate(hits)
+        ]
+    
+    def bump_generation(self):
+        """Invalidate cached search results after the indexed content changed"""
+        self.generation += 1
+        self.search_cache.clear()
+    
+    def _search_cache_key(self, query: str, n_results: int, filter_metadata: Optional[Dict], mode: str = "vector"):
+        return (
+            self.generation,
+            mode,
+            normalize_query(query),
+            n_results,
+            json.dumps(filter_metadata, sort_keys=True) if filter_metadata else None
+        )
+    
+    def _effective_mode(self, mode: Optional[str]) -> str:
+        """Resolve the search mode, taking the BM25 fast path while the embedding model loads"""
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        if mode != "bm25" and BM25_FAST_PATH and not embedding_engine.is_loaded and len(self.bm25_index):
+            embedding_engine.load_in_background()
+            return "bm25"
+        return mode
+    
+    def _fetch_records(self, ids: List[str], filter_metadata: Optional[Dict]) -> Dict[str, tuple]:
+        """Content and metadata of the given chunks that pass the filter"""
+        records = self.collection.get(ids=ids, where=filter_metadata or None, include=["documents", "metadatas"])
+        return {
+            chunk_id: (doc, metadata, None)
+            for chunk_id, doc, metadata in zip(records['ids'], records['documents'], records['metadatas'])
+        }
+    
+    def _fuse(self, query: str, vector_hits: list, n_results: int, candidates: int,
+              filter_metadata: Optional[Dict]) -> List[Dict[str, Any]]:
+        """Reciprocal rank fusion of the vector hits with the BM25 ranking of the query"""
+        records = {chunk_id: (doc, metadata, 1 - distance) for chunk_id, doc, metadata, distance in vector_hits}
+        scores: Dict[str, float] = {}
+        for rank, hit in enumerate(vector_hits):
+            scores[hit[0]] = 1.0 / (RRF_K + rank + 1)
+        
+        bm25_hits = self.bm25_index.search(query, candidates)
+        top_score = bm25_hits[0][1] if bm25_hits else 1.0
+        bm25_relevance = {chunk_id: score / top_score for chunk_id, score in bm25_hits}
+        for rank, (chunk_id, _) in enumerate(bm25_hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        
+        unseen = [chunk_id for chunk_id, _ in bm25_hits if chunk_id not in records]
+        if unseen:
+            records.update(self._fetch_records(unseen, filter_metadata))
+        
+        ranked = sorted((chunk_id for chunk_id in scores if chunk_id in records), key=lambda chunk_id: (-scores[chunk_id], chunk_id))
+        results = []
+        for i, chunk_id in enumerate(ranked[:n_results]):
+            doc, metadata, similarity = records[chunk_id]
+            results.append({
+                'content': doc,
+                'metadata': metadata,
+                'relevance_score': similarity if similarity is not None else bm25_relevance[chunk_id],
+                'rank': i + 1
+            })
+        return results
+    
+    def _retrieve(self, queries: List[str], n_results: int, filter_metadata: Optional[Dict], mode: str) -> List[List[Dict[str, Any]]]:
+        candidates = n_results if mode == "vector" else n_results * HYBRID_CANDIDATES
+        vector_hits = [[] for _ in queries]
+        if mode != "bm25":
+            vector_hits = self.search_backend.query(embedding_engine.embed_queries(queries), candidates, filter_metadata)
+            if mode == "vector":
+                return [self._format_hits(hits) for hits in vector_hits]
+        return [
+            self._fuse(query, hits, n_results, candidates, filter_metadata)
+            for query, hits in zip(queries, vector_hits)
+        ]
+    
+    def search(self, query: str, n_results: int = 3, filter_metadata: Dict = None, mode: Optional[str] = None):
         """Search for similar documents with enhanced results"""
+        return self.search_many([query], n_results, filter_metadata, mode)[0]
+    
+    def search_many(self, queries: List[str], n_results: int = 3, filter_metadata: Dict = None,
+                    mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Search several queries at once: one batched embedding and one multi-query backend call.
+        
+        mode is "vector", "bm25" or "hybrid" (reciprocal rank fusion of both), defaulting
+        to SEARCH_MODE. While the embedding model is not loaded yet, BM25 answers alone.
+        """
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results,
-                where=filter_metadata
-            )
-            
-            # Format results nicely
-            formatted_results = []
-            if results['documents']:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results['documents'][0], 
-                    results['metadatas'][0], 
-                    results['distances'][0] if results['distances'] else [1.0] * len(results['documents'][0])
-                )):
-                    formatted_results.append({
-                        'content': doc,
-                        'metadata': metadata,
-                        'relevance_score': 1 - distance,  # Convert distance to similarity score
-                        'rank': i + 1
-                    })
-            
-            return formatted_results
+            mode = self._effective_mode(mode)
+            results: List[Optional[List[Dict[str, Any]]]] = []
+            cache_keys = [self._search_cache_key(query, n_results, filter_metadata, mode) for query in queries]
+            for cache_key in cache_keys:
+                results.append(self.search_cache.get(cache_key))
+                
+            missing = [i for i, cached in enumerate(results) if cached is None]
+            if missing:
+                retrieved = self._retrieve([queries[i] for i in missing], n_results, filter_metadata, mode)
+                for i, query_results in zip(missing, retrieved):
+                    results[i] = query_results
+                    self.search_cache.put(cache_keys[i], query_results)
+                    
+            return [[dict(result) for result in query_results] for query_results in results]
             
         except Exception as e:
             logger.error(f"Error searching vector store: {str(e)}")
-            return []
+            return [[] for _ in queries]
+    
+    async def search_async(self, query: str, n_results: int = 3, filter_metadata: Dict = None, mode: Optional[str] = None):
+        """Non-blocking search: runs on the bounded retrieval executor instead of the event loop"""
+        return await retrieval_executor.run(self.search, query, n_results, filter_metadata, mode)
+    
+    async def search_many_async(self, queries: List[str], n_results: int = 3, filter_metadata: Dict = None,
+                                mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Non-blocking search_many on the bounded retrieval executor"""
+        return await retrieval_executor.run(self.search_many, queries, n_results, filter_metadata, mode)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the query embedding and search result caches"""
+        return {
+            "generation": self.generation,
+            "query_embeddings": embedding_engine.query_cache.stats(),
+            "search_results": self.search_cache.stats()
+        }
     
     def get_collection_info(self):
         """Get information about the collection - FIXED VERSION"""
@@ -83,7 +633,12 @@ class VectorStore:
             count = self.collection.count()
             return {
                 "document_count": count,
-                "is_initialized": self.is_initialized
+                "is_initialized": self.is_initialized,
+                "search_backend": self.search_backend_name,
+                "search_index": self.search_backend.info(),
+                "search_mode": self.search_mode,
+                "bm25_chunks": len(self.bm25_index),
+                "shards": self._shard_info()
             }
         except Exception as e:
             logger.error(f"Error getting collection info: {str(e)}")
@@ -92,15 +647,79 @@ class VectorStore:
                 "is_initialized": False
             }
     
+    def _shard_info(self) -> Dict[str, Any]:
+        if not isinstance(self.collection, ShardedCollection):
+            return {"count": 1}
+        return {
+            "count": self.shard_count,
+            "shard_by": self.shard_by,
+            "chunks": [shard.count() for shard in self.collection.shards]
+        }
+    
+    def _reset_collection(self):
+        """Drop and recreate the collection (and any shards), e.g. when the vector dimension may change"""
+        try:
+            # Also drops the collections of an earlier shard layout
+            names = [getattr(collection, "name", collection) for collection in self.client.list_collections()]
+        except Exception as e:
+            logger.debug(f"Could not list collections: {str(e)}")
+            names = [COLLECTION_NAME]
+        for name in names:
+            if name != COLLECTION_NAME and not name.startswith(f"{COLLECTION_NAME}_shard"):
+                continue
+            try:
+                self.client.delete_collection(name)
+            except Exception as e:
+                # Nothing to drop yet
+                logger.debug(f"Collection {name} not deleted: {str(e)}")
+        self._collection = self._get_or_create_collection(self.client)
+        if isinstance(self._collection, ShardedCollection):
+            self._collection.router.clear()
+            self._collection.router.save()
+    
+    def export_snapshot(self, archive_path: str) -> Dict[str, Any]:
+        """Write the current knowledge base to a versioned snapshot archive"""
+        return export_snapshot(self.persistence_dir, archive_path)
+    
+    def load_snapshot(self, archive_path: str) -> bool:
+        """Install a snapshot archive (if not already in place) and serve it without ingesting"""
+        if self._client is not None:
+            raise RuntimeError("Snapshots must be loaded before the vector store is opened")
+        info = import_snapshot(archive_path, self.persistence_dir, expected_settings=self.ingest_settings())
+        self.manifest = IngestManifest.load(self.persistence_dir)
+        # Read from the snapshot on next use
+        self._bm25_index = None
+        self._search_backend = None
+        self.is_initialized = False
+        self.bump_generation()
+        logger.info(f"Serving knowledge base snapshot {info['version'][:12]} created {info['created_at']}")
+        return self.restore()
+    
+    def compact_storage(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Remove segment directories left behind by dropped collections and vacuum the catalog"""
+        if self.read_only and not dry_run:
+            return {"error": "vector store is read-only", "bytes_reclaimed": 0}
+        try:
+            return compact_store(self.persistence_dir, dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"Error compacting vector store: {str(e)}")
+            return {"error": str(e), "bytes_reclaimed": 0}
+    
     def clear_knowledge_base(self):
         """Clear the knowledge base (for testing)"""
+        if self.read_only:
+            logger.warning("Vector store is read-only, not clearing the knowledge base")
+            return False
         try:
-            self.client.delete_collection("agricultural_knowledge")
-            self.collection = self.client.get_or_create_collection(
-                name="agricultural_knowledge",
-                metadata={"description": "Agricultural knowledge base for crop advisory"}
-            )
-            self.is_initialized = False
+            with self._ingest_lock:
+                self._reset_collection()
+                self.manifest.clear()
+                self.manifest.save()
+                self.bm25_index.clear()
+                self.bm25_index.save()
+                self.search_backend.refresh()
+                self.bump_generation()
+                self.is_initialized = False
             logger.info("Knowledge base cleared")
             return True
         except Exception as e:
@@ -3,6 +3,7 @@ import os
 import logging
 import random
 from dotenv import load_dotenv
+from app.agents.llm_cache import llm_cache
 
 load_dotenv()
 
@@ -21,7 +22,7 @@ class SimpleWeatherWorkflow:
         genai.configure(api_key=api_key)
         return genai.GenerativeModel('gemini-2.5-flash')
     
-    def generate_weather_alert(self, location: str) -> dict:
+    def generate_weather_alert(self, location: str, use_cache: bool = True) -> dict:
         """Generate weather advice - SIMPLE and RELIABLE"""
         try:
             # Simulate weather data
@@ -32,7 +33,7 @@ class SimpleWeatherWorkflow:
             # Use Gemini for quick advice
             prompt = f"Give one sentence of farming advice for {location} with {condition} weather at {temperature}°C for maize crops."
             
-            response = self.gemini_client.generate_content(prompt)
+            advice = llm_cache.generate(self.gemini_client, prompt, use_cache)
             
             return {
                 "success": True,
@@ -43,7 +44,7 @@ class SimpleWeatherWorkflow:
                     "temperature": temperature,
                     "humidity": random.randint(40, 90)
                 },
-                "ai_advice": response.text,
+                "ai_advice": advice,
                 "timestamp": "2024-01-01T00:00:00Z"
             }
                 
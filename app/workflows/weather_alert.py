@@ -7,6 +7,7 @@ from typing import Dict, Any
 from dotenv import load_dotenv
 from datetime import datetime
 from requests.adapters import HTTPAdapter
+from app.agents.llm_cache import llm_cache
 from urllib3.util.retry import Retry
 
 load_dotenv()
@@ -116,7 +117,7 @@ class RealWeatherWorkflow:
     #         "note": "Simulated data due to API failure"
     #     }
     
-    def generate_weather_alert(self, location: str, use_real_weather: bool = True) -> Dict[str, Any]:
+    def generate_weather_alert(self, location: str, use_real_weather: bool = True, use_cache: bool = True) -> Dict[str, Any]:
         """Generate comprehensive agricultural advice with real weather data or fallback to simulation"""
         try:
             # Get weather data (real or simulated)
@@ -163,7 +164,7 @@ class RealWeatherWorkflow:
 **RESPONSE FORMAT**: Use clear, simple language with bullet points remove starts that are here."""
 
             logger.info(f"Generating weather advice for {location} with {condition} at {temperature}°C")
-            response = self.gemini_client.generate_content(prompt)
+            advice = llm_cache.generate(self.gemini_client, prompt, use_cache)
             
             return {
                 "success": True,
@@ -175,7 +176,7 @@ class RealWeatherWorkflow:
                     "location": location,
                     "weather_condition": condition,
                     "temperature": temperature,
-                    "ai_advice": response.text,
+                    "ai_advice": advice,
                     "data_source": data_source,
                     "generated_at": datetime.now().isoformat()
                 },
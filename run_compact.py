@@ -0,0 +1,21 @@
+import argparse
+from app.rag.maintenance import compact_store
+
+def format_bytes(size):
+    return f"{size / (1024 * 1024):.2f} MB"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove orphaned Chroma segments and vacuum the vector store")
+    parser.add_argument("--persistence-dir", default="./app/data/chroma_db", help="Chroma persistence directory")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    args = parser.parse_args()
+
+    report = compact_store(args.persistence_dir, dry_run=args.dry_run)
+    for name in report["orphaned_segments"]:
+        print(f"🗑️  {'Would remove' if args.dry_run else 'Removed'} orphaned segment {name}")
+    if args.dry_run:
+        print(f"📊 {len(report['orphaned_segments'])} orphaned segments, {format_bytes(report['segment_bytes'])} reclaimable "
+              f"(plus free pages in chroma.sqlite3)")
+    else:
+        print(f"📊 chroma.sqlite3: {format_bytes(report['sqlite_bytes_before'])} -> {format_bytes(report['sqlite_bytes_after'])}")
+        print(f"✅ Reclaimed {format_bytes(report['bytes_reclaimed'])}")
@@ -1,12 +1,55 @@
-from app.rag.vector_store import VectorStore
+import argparse
+import time
+from app.rag.vector_store import VectorStore, INGEST_BATCH_SIZE
+from app.rag.document_processor import INGEST_WORKERS
+
+def print_progress(stats):
+    elapsed = max(time.time() - stats["started_at"], 1e-6)
+    embed_rate = stats["embeddings_computed"] / stats["embed_seconds"] if stats["embed_seconds"] else 0.0
+    print(
+        f"⏳ [{stats['files_committed']}/{stats['files_total']} files] "
+        f"{stats['chunks_processed']} chunks ({stats['chunks_processed'] / elapsed:.1f} chunks/s), "
+        f"{stats['embeddings_computed']} embeddings ({embed_rate:.1f} embeddings/s), "
+        f"batch {stats['batches']} checkpointed"
+    )
+
+def print_summary(stats):
+    if not stats:
+        return
+    elapsed = time.time() - stats["started_at"]
+    other = max(elapsed - stats["embed_seconds"] - stats["upsert_seconds"], 0.0)
+    print(f"📊 {stats['files_processed']} files processed, {stats['files_unchanged']} unchanged files skipped")
+    print(f"   {stats['chunks_processed']} chunks, {stats['chunks_upserted']} upserted, "
+          f"{stats['embeddings_computed']} newly embedded")
+    print(f"   Time: {elapsed:.1f}s total = {other:.1f}s extract/chunk + "
+          f"{stats['embed_seconds']:.1f}s embed + {stats['upsert_seconds']:.1f}s upsert")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the agricultural knowledge base")
+    parser.add_argument("--documents-dir", default="./app/data/documents", help="Directory of .pdf/.txt documents")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Extraction processes (1 = serial)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Chunks embedded and written per batch")
+    parser.add_argument("--restart", action="store_true", help="Ignore the last checkpoint and rebuild every document")
+    parser.add_argument("--snapshot", help="Also export the knowledge base to this snapshot archive (.tar.gz)")
+    args = parser.parse_args()
+
     store = VectorStore()
-    success = store.initialize_knowledge_base()
+    success = store.initialize_knowledge_base(
+        args.documents_dir,
+        force=args.restart,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        progress=print_progress
+    )
+    print_summary(store.last_ingest_stats)
 
     if success:
         print("✅ Knowledge base initialized successfully!")
         info = store.get_collection_info()
         print(info)
+        if args.snapshot:
+            snapshot = store.export_snapshot(args.snapshot)
+            print(f"📦 Snapshot {snapshot['version'][:12]} ({snapshot['chunk_count']} chunks) written to {args.snapshot}")
     else:
         print("❌ Failed to initialize knowledge base.")
+        raise SystemExit(1)
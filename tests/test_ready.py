@@ -0,0 +1,29 @@
+import requests
+import time
+
+def test_ready():
+    base_url = "http://localhost:8000"
+    
+    print("🚦 READINESS TEST")
+    print("=" * 40)
+    
+    try:
+        start_time = time.time()
+        health = requests.get(f"{base_url}/health", timeout=5)
+        print(f"Health: {health.status_code} in {time.time() - start_time:.2f}s")
+        
+        # Poll /ready until the embedding model and vector store are warmed up
+        for attempt in range(30):
+            ready = requests.get(f"{base_url}/ready", timeout=5)
+            print(f"Ready: {ready.status_code} -> {ready.json()}")
+            if ready.status_code == 200:
+                print(f"✅ Ready after {time.time() - start_time:.1f}s")
+                return
+            time.sleep(2)
+        
+        print("⏰ Service did not become ready within 60 seconds")
+    except Exception as e:
+        print(f"💥 Error: {e}")
+
+if __name__ == "__main__":
+    test_ready()
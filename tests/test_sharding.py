@@ -0,0 +1,123 @@
+import sys, os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.rag.sharding import ShardRouter, ShardedCollection
+
+class MemoryCollection:
+    """Just enough of a Chroma collection for ShardedCollection: exact-match where filters only"""
+    
+    def __init__(self):
+        self.rows = {}
+    
+    def _matches(self, metadata, where):
+        for field, condition in (where or {}).items():
+            if field == "$and":
+                if not all(self._matches(metadata, clause) for clause in condition):
+                    return False
+            elif field == "$or":
+                if not any(self._matches(metadata, clause) for clause in condition):
+                    return False
+            elif metadata.get(field) != condition:
+                return False
+        return True
+    
+    def count(self):
+        return len(self.rows)
+    
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        for i, chunk_id in enumerate(ids):
+            self.rows[chunk_id] = (embeddings[i], documents[i], metadatas[i])
+    
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+    
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        keys = [key for key in (ids if ids is not None else list(self.rows))
+                if key in self.rows and self._matches(self.rows[key][2], where)]
+        keys = keys[offset or 0:][:limit]
+        return {
+            "ids": keys,
+            "documents": [self.rows[key][1] for key in keys],
+            "metadatas": [self.rows[key][2] for key in keys]
+        }
+    
+    def query(self, query_embeddings, n_results=10, where=None):
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in query_embeddings:
+            hits = sorted(
+                (sum((a - b) ** 2 for a, b in zip(row[0], query)), key)
+                for key, row in self.rows.items() if self._matches(row[2], where)
+            )[:n_results]
+            result["ids"].append([key for _, key in hits])
+            result["distances"].append([distance for distance, _ in hits])
+            result["documents"].append([self.rows[key][1] for _, key in hits])
+            result["metadatas"].append([self.rows[key][2] for _, key in hits])
+        return result
+
+def _sharded(directory, shard_by):
+    shards = [MemoryCollection() for _ in range(4)]
+    return ShardedCollection(shards, ShardRouter(directory, 4, shard_by))
+
+def test_router_prunes_filtered_queries():
+    with tempfile.TemporaryDirectory() as directory:
+        collection = _sharded(directory, "crop")
+        collection.upsert(
+            ids=["m", "w", "g"],
+            embeddings=[[0.0], [1.0], [2.0]],
+            documents=["maize", "wheat", "general"],
+            metadatas=[
+                {"source": "a.txt", "crop": "maize", "crop_maize": True},
+                {"source": "b.txt", "crop": "wheat", "crop_wheat": True},
+                {"source": "c.txt", "crop": "general"}
+            ]
+        )
+        router = collection.router
+        maize_filter = {"$or": [{"crop_maize": True}, {"crop": "general"}]}
+        assert router.route(maize_filter) == sorted({router.shard_for({"crop": "maize"}), router.shard_for({"crop": "general"})})
+        assert router.route({"source": "a.txt"}) == [0, 1, 2, 3]
+        
+        result = collection.query([[0.0]], n_results=3, where=maize_filter)
+        assert result["ids"] == [["m", "g"]]
+        assert collection.query([[1.9]], n_results=2)["ids"] == [["g", "w"]]
+        
+        # The routing table survives a restart
+        assert ShardRouter(directory, 4, "crop").values == router.values
+
+def test_retagged_chunk_moves_shard():
+    with tempfile.TemporaryDirectory() as directory:
+        collection = _sharded(directory, "crop")
+        collection.upsert(ids=["a"], embeddings=[[0.0]], documents=["maize text"],
+                          metadatas=[{"source": "a.txt", "crop": "maize"}])
+        collection.upsert(ids=["a"], embeddings=[[0.0]], documents=["wheat text"],
+                          metadatas=[{"source": "a.txt", "crop": "wheat"}])
+        assert collection.count() == 1
+        assert collection.get(ids=["a"])["documents"] == ["wheat text"]
+
+def test_paged_get_spans_shards():
+    with tempfile.TemporaryDirectory() as directory:
+        collection = _sharded(directory, "hash")
+        ids = [f"doc{i}_chunk0" for i in range(10)]
+        collection.upsert(ids=ids, embeddings=[[float(i)] for i in range(10)], documents=ids,
+                          metadatas=[{"source": f"doc{i}.txt"} for i in range(10)])
+        pages = [collection.get(include=["documents"], limit=3, offset=offset)["ids"] for offset in range(0, 12, 3)]
+        assert sorted(sum(pages, [])) == sorted(ids)
+        collection.delete(ids=ids[:4])
+        assert collection.count() == 6
+
+def test_filtered_paged_get_spans_shards():
+    with tempfile.TemporaryDirectory() as directory:
+        collection = _sharded(directory, "hash")
+        ids = [f"doc{i}_chunk0" for i in range(12)]
+        collection.upsert(ids=ids, embeddings=[[float(i)] for i in range(12)], documents=ids,
+                          metadatas=[{"source": f"doc{i}.txt", "crop": "maize" if i % 3 else "wheat"} for i in range(12)])
+        maize = [chunk_id for i, chunk_id in enumerate(ids) if i % 3]
+        pages = [collection.get(where={"crop": "maize"}, include=[], limit=3, offset=offset)["ids"] for offset in range(0, 9, 3)]
+        assert sorted(sum(pages, [])) == sorted(maize)
+
+if __name__ == "__main__":
+    for test in (test_router_prunes_filtered_queries, test_retagged_chunk_moves_shard, test_paged_get_spans_shards,
+                 test_filtered_paged_get_spans_shards):
+        test()
+        print(f"✅ {test.__name__}")